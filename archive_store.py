@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import zlib
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from dotenv import load_dotenv
+
+# zstandard is in requirements.txt; without it new blobs are compressed with zlib, but existing .zst blobs cannot be read
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Load environment variables
+load_dotenv()
+
+ARCHIVE_WORKERS = int(os.getenv('ARCHIVE_WORKERS', 4))  # Files hashed and compressed at once
+ARCHIVE_ZSTD_LEVEL = int(os.getenv('ARCHIVE_ZSTD_LEVEL', 10))
+ARCHIVE_KEEP_RUNS = int(os.getenv('ARCHIVE_KEEP_RUNS', 0))  # Always keep the newest N runs (0 = no limit by count)
+ARCHIVE_KEEP_DAYS = float(os.getenv('ARCHIVE_KEEP_DAYS', 0))  # Also keep runs younger than this (0 = no limit by age)
+
+# Already-compressed formats are stored as they are
+INCOMPRESSIBLE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.avif', '.zip', '.gz', '.zst', '.xz', '.bz2', '.mp3', '.mp4', '.woff2'}
+MULTITHREAD_MIN_BYTES = 4 * 1024 * 1024  # Blobs at least this large are compressed with zstd's own worker threads
+
+class ArchiveStore:
+    # Content-addressed archive: every unique file is stored once under blobs/ (by SHA-256), and each cleanup run
+    # writes a manifest under runs/ mapping archive paths to blobs, so unchanged files cost nothing in later runs
+    def __init__(self, directory='archives', workers=ARCHIVE_WORKERS, level=ARCHIVE_ZSTD_LEVEL):
+        self.directory = os.path.join(directory, 'store')
+        self.blobs_dir = os.path.join(self.directory, 'blobs')
+        self.runs_dir = os.path.join(self.directory, 'runs')
+        self.workers = workers
+        self.level = level
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.runs_dir, exist_ok=True)
+
+    def blob_path(self, content_hash, codec):
+        return os.path.join(self.blobs_dir, content_hash[:2], f"{content_hash}.{codec}")
+
+    def find_blob(self, content_hash):
+        for codec in ('zst', 'zz', 'raw'):
+            path = self.blob_path(content_hash, codec)
+            if os.path.exists(path):
+                return path, codec
+        return None, None
+
+    def compress(self, data, name):
+        # Returns (codec, stored bytes); data that does not shrink by at least 5% is kept raw
+        if os.path.splitext(name)[1].lower() in INCOMPRESSIBLE_EXTENSIONS:
+            return 'raw', data
+        if zstandard:
+            threads = -1 if len(data) >= MULTITHREAD_MIN_BYTES else 0
+            codec, compressed = 'zst', zstandard.ZstdCompressor(level=self.level, threads=threads).compress(data)
+        else:
+            codec, compressed = 'zz', zlib.compress(data, 6)
+        if len(compressed) >= len(data) * 0.95:
+            return 'raw', data
+        return codec, compressed
+
+    def decompress(self, codec, data):
+        if codec == 'zst':
+            if zstandard is None:
+                raise RuntimeError("This archive has zstd-compressed blobs: install zstandard (pip install zstandard) to restore them")
+            return zstandard.ZstdDecompressor().decompress(data)
+        if codec == 'zz':
+            return zlib.decompress(data)
+        return data
+
+    def store_file(self, file_path):
+        # Returns (hash, size, stored bytes written by this call)
+        with open(file_path, 'rb') as f:
+            data = f.read()
+        content_hash = hashlib.sha256(data).hexdigest()
+        if self.find_blob(content_hash)[0]:
+            return content_hash, len(data), 0
+        codec, stored = self.compress(data, file_path)
+        path = self.blob_path(content_hash, codec)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(stored)
+        os.replace(tmp_path, path)
+        return content_hash, len(data), len(stored)
+
+    def archive(self, run_id, items):
+        # Same layout as the zip archives: directories keep their name, files are stored at the top level
+        files = []
+        for item in items:
+            if os.path.isdir(item):
+                for root, _, names in os.walk(item):
+                    for name in sorted(names):
+                        file_path = os.path.join(root, name)
+                        files.append((file_path, os.path.relpath(file_path, start=os.path.dirname(item))))
+            elif os.path.isfile(item):
+                files.append((item, os.path.basename(item)))
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            results = list(executor.map(lambda entry: self.store_file(entry[0]), files))
+
+        manifest = {
+            'run_id': run_id,
+            'created_at': time.time(),
+            'files': [{'path': arcname.replace(os.sep, '/'), 'hash': content_hash, 'size': size}
+                      for (_, arcname), (content_hash, size, _) in zip(files, results)]
+        }
+        path = os.path.join(self.runs_dir, f"{run_id}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=4)
+        os.replace(tmp_path, path)
+
+        total = sum(size for _, size, _ in results)
+        written = sum(stored for _, _, stored in results)
+        new_blobs = sum(1 for _, _, stored in results if stored)
+        print(f"Archived {len(files)} files ({total / 1024 / 1024:.1f} MB) as run {run_id}: "
+              f"{new_blobs} new blobs, {written / 1024 / 1024:.1f} MB written, {len(files) - new_blobs} already stored")
+        return manifest
+
+    def runs(self):
+        # Manifests sorted from oldest to newest
+        manifests = []
+        for name in os.listdir(self.runs_dir):
+            if name.endswith('.json'):
+                with open(os.path.join(self.runs_dir, name), 'r', encoding='utf-8') as f:
+                    manifests.append(json.load(f))
+        return sorted(manifests, key=lambda manifest: manifest['created_at'])
+
+    def load_run(self, run_id):
+        runs = self.runs()
+        if run_id == 'latest':
+            if not runs:
+                raise ValueError("The archive has no runs")
+            return runs[-1]
+        for manifest in runs:
+            if manifest['run_id'] == run_id:
+                return manifest
+        raise ValueError(f"No archived run {run_id}")
+
+    def restore(self, run_id, target_dir):
+        manifest = self.load_run(run_id)
+
+        def restore_file(entry):
+            path, codec = self.find_blob(entry['hash'])
+            if not path:
+                raise ValueError(f"Missing blob {entry['hash']} for {entry['path']}")
+            with open(path, 'rb') as f:
+                data = self.decompress(codec, f.read())
+            if hashlib.sha256(data).hexdigest() != entry['hash']:
+                raise ValueError(f"Corrupt blob {entry['hash']} for {entry['path']}")
+            destination = os.path.join(target_dir, *entry['path'].split('/'))
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            with open(destination, 'wb') as f:
+                f.write(data)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            list(executor.map(restore_file, manifest['files']))
+        print(f"Restored {len(manifest['files'])} files from run {manifest['run_id']} to {target_dir}")
+
+    def prune(self, keep_runs=ARCHIVE_KEEP_RUNS, keep_days=ARCHIVE_KEEP_DAYS):
+        # A run is kept if it is among the newest keep_runs or younger than keep_days; with both at 0 nothing is pruned.
+        # Blobs no longer referenced by any kept run are deleted afterwards.
+        if not keep_runs and not keep_days:
+            return
+        runs = self.runs()
+        cutoff = time.time() - keep_days * 86400 if keep_days else None
+        kept = []
+        for index, manifest in enumerate(runs):
+            newest = keep_runs and index >= len(runs) - keep_runs
+            recent = cutoff is not None and manifest['created_at'] >= cutoff
+            if newest or recent:
+                kept.append(manifest)
+            else:
+                os.remove(os.path.join(self.runs_dir, f"{manifest['run_id']}.json"))
+
+        referenced = {entry['hash'] for manifest in kept for entry in manifest['files']}
+        removed = freed = 0
+        for root, _, names in os.walk(self.blobs_dir):
+            for name in names:
+                if name.endswith('.tmp') or name.split('.')[0] not in referenced:
+                    path = os.path.join(root, name)
+                    freed += os.path.getsize(path)
+                    os.remove(path)
+                    removed += 1
+        print(f"Pruned {len(runs) - len(kept)} runs and {removed} blobs ({freed / 1024 / 1024:.1f} MB), {len(kept)} runs kept")
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect, restore and prune the content-addressed archive")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('list', help="list archived runs")
+    restore_parser = subparsers.add_parser('restore', help="restore the files of one run")
+    restore_parser.add_argument('run_id', help="run id from 'list', or 'latest'")
+    restore_parser.add_argument('--to', default=None, help="target directory (default: restore/<run_id>)")
+    prune_parser = subparsers.add_parser('prune', help="delete old runs and the blobs only they referenced")
+    prune_parser.add_argument('--keep-runs', type=int, default=ARCHIVE_KEEP_RUNS, help="always keep the newest N runs")
+    prune_parser.add_argument('--keep-days', type=float, default=ARCHIVE_KEEP_DAYS, help="also keep runs younger than this many days")
+    args = parser.parse_args()
+
+    store = ArchiveStore()
+    if args.command == 'list':
+        for manifest in store.runs():
+            size = sum(entry['size'] for entry in manifest['files'])
+            created = datetime.fromtimestamp(manifest['created_at']).strftime('%Y-%m-%d %H:%M:%S')
+            print(f"{manifest['run_id']}  {created}  {len(manifest['files'])} files  {size / 1024 / 1024:.1f} MB")
+    elif args.command == 'restore':
+        manifest = store.load_run(args.run_id)
+        store.restore(manifest['run_id'], args.to or os.path.join('restore', manifest['run_id']))
+    else:
+        if not args.keep_runs and not args.keep_days:
+            parser.error("set --keep-runs and/or --keep-days (or ARCHIVE_KEEP_RUNS / ARCHIVE_KEEP_DAYS)")
+        store.prune(args.keep_runs, args.keep_days)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from dotenv import load_dotenv
+from stage_types import Article
+
+class ArticleStore:
+    # 文章的唯一数据源：元数据、正文、评分与摘要按列保存在 SQLite 中，标题与正文建 FTS5 全文索引。
+    # 尚未随新闻通讯发布（published_at 为空）的文章构成当前一期，各阶段按条件查询而不再扫描目录
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS articles (
+                id INTEGER PRIMARY KEY,
+                url TEXT UNIQUE,
+                filename TEXT UNIQUE,
+                title TEXT,
+                date TEXT,
+                body TEXT,
+                fetched_at REAL,
+                updated_at REAL,
+                score REAL,
+                rated_at REAL,
+                summary TEXT,
+                summarized_at REAL,
+                published_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_articles_published_score ON articles (published_at, score);
+            CREATE INDEX IF NOT EXISTS idx_articles_fetched_at ON articles (fetched_at);
+        """)
+        try:
+            # 外部内容表：全文索引只保存倒排表，由触发器与 articles 保持同步
+            self.conn.executescript("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(title, body, content='articles', content_rowid='id');
+                CREATE TRIGGER IF NOT EXISTS articles_ai AFTER INSERT ON articles BEGIN
+                    INSERT INTO articles_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+                END;
+                CREATE TRIGGER IF NOT EXISTS articles_ad AFTER DELETE ON articles BEGIN
+                    INSERT INTO articles_fts (articles_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+                END;
+                CREATE TRIGGER IF NOT EXISTS articles_au AFTER UPDATE OF title, body ON articles BEGIN
+                    INSERT INTO articles_fts (articles_fts, rowid, title, body) VALUES ('delete', old.id, old.title, old.body);
+                    INSERT INTO articles_fts (rowid, title, body) VALUES (new.id, new.title, new.body);
+                END;
+            """)
+            self.full_text = True
+        except sqlite3.OperationalError:
+            # 当前 SQLite 未编译 FTS5 时只是无法全文搜索
+            self.full_text = False
+        self.conn.commit()
+
+    def to_article(self, row):
+        # 文本与 articles_text/ 中的 .txt 文件格式一致，评分单独放在 score 中
+        text = f"Title: {row['title']}\nURL: {row['url']}\nDate: {row['date']}\n\n{row['body']}"
+        summary = json.loads(row['summary']) if row['summary'] else None
+        return Article(row['filename'], text, row['score'], id=row['id'], url=row['url'], title=row['title'], summary=summary)
+
+    def unique_filename(self, title, url):
+        # 同标题的不同文章各自保留，文件名依次加编号
+        base = f"{title}.txt".replace('/', '_').replace('\\', '_')
+        filename = base
+        number = 2
+        while True:
+            row = self.conn.execute("SELECT url FROM articles WHERE filename = ?", (filename,)).fetchone()
+            if row is None or row['url'] == url:
+                return filename
+            filename = f"{base[:-4]} ({number}).txt"
+            number += 1
+
+    def add(self, title, url, date, body):
+        # 同一 URL 再次保存时若仍在当前一期，正文未变则保留已有的评分与摘要；
+        # 已随新闻通讯发布过的文章保持已发布状态并返回 None，不会再次进入新闻通讯
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM articles WHERE url = ?", (url,)).fetchone()
+            if row is not None and row['published_at'] is not None:
+                return None
+            if row is None:
+                self.conn.execute(
+                    "INSERT INTO articles (url, filename, title, date, body, fetched_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, self.unique_filename(title, url), title, date, body, now, now)
+                )
+            elif row['body'] != body or row['title'] != title:
+                self.conn.execute(
+                    "UPDATE articles SET title = ?, date = ?, body = ?, fetched_at = ?, updated_at = ?, score = NULL, rated_at = NULL, "
+                    "summary = NULL, summarized_at = NULL WHERE id = ?",
+                    (title, date, body, now, now, row['id'])
+                )
+            else:
+                self.conn.execute("UPDATE articles SET date = ?, fetched_at = ? WHERE id = ?", (date, now, row['id']))
+            self.conn.commit()
+            row = self.conn.execute("SELECT * FROM articles WHERE url = ?", (url,)).fetchone()
+        return self.to_article(row)
+
+    def set_score(self, article_id, score):
+        with self.lock:
+            self.conn.execute("UPDATE articles SET score = ?, rated_at = ? WHERE id = ?", (score, time.time(), article_id))
+            self.conn.commit()
+
+    def set_summary(self, article_id, summary):
+        with self.lock:
+            self.conn.execute("UPDATE articles SET summary = ?, summarized_at = ? WHERE id = ?",
+                              (json.dumps(summary, ensure_ascii=False), time.time(), article_id))
+            self.conn.commit()
+
+    def query(self, where, params=(), order='id', limit=None):
+        sql = f"SELECT * FROM articles WHERE {where} ORDER BY {order}"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        with self.lock:
+            rows = self.conn.execute(sql, params).fetchall()
+        return [self.to_article(row) for row in rows]
+
+    def current(self):
+        # 当前一期的全部文章
+        return self.query("published_at IS NULL")
+
+    def unrated(self, since=None):
+        # 当前一期中尚未评分的文章；since 为时间戳时只取此后抓取的文章
+        return self.query("published_at IS NULL AND score IS NULL AND fetched_at >= ?", (since or 0,))
+
+    def top(self, limit, since=None):
+        # 当前一期评分最高的文章，同分时先抓取的在前
+        return self.query("published_at IS NULL AND score IS NOT NULL AND fetched_at >= ?", (since or 0,),
+                          order='score DESC, id', limit=limit)
+
+    def ratings(self):
+        with self.lock:
+            rows = self.conn.execute("SELECT filename, score FROM articles WHERE published_at IS NULL AND score IS NOT NULL ORDER BY id").fetchall()
+        return {row['filename']: row['score'] for row in rows}
+
+    def search(self, text, limit=20):
+        # FTS5 查询语法，按相关度排序；包括已发布的历史文章
+        if not self.full_text:
+            raise RuntimeError("SQLite was built without FTS5, full-text search is unavailable")
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT articles.* FROM articles_fts JOIN articles ON articles.id = articles_fts.rowid "
+                "WHERE articles_fts MATCH ? ORDER BY rank LIMIT ?", (text, limit)
+            ).fetchall()
+        return [self.to_article(row) for row in rows]
+
+    def fingerprint(self):
+        # 当前一期文章及其评分的摘要，流水线用它判断评分与摘要阶段的输入是否变化
+        digest = hashlib.sha256()
+        with self.lock:
+            for row in self.conn.execute("SELECT id, updated_at, score FROM articles WHERE published_at IS NULL ORDER BY id"):
+                digest.update(f"{row['id']}:{row['updated_at']}:{row['score']}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def publish(self):
+        # 新闻通讯发布后结束当前一期，文章保留在库中供搜索
+        with self.lock:
+            count = self.conn.execute("UPDATE articles SET published_at = ? WHERE published_at IS NULL", (time.time(),)).rowcount
+            self.conn.commit()
+        return count
+
+    def report(self):
+        with self.lock:
+            current, rated, total = self.conn.execute(
+                "SELECT COALESCE(SUM(published_at IS NULL), 0), COALESCE(SUM(published_at IS NULL AND score IS NOT NULL), 0), COUNT(*) FROM articles"
+            ).fetchone()
+        print(f"Article store: {current} articles in the current edition ({rated} rated), {total} in total")
+
+    def export_text(self, folder):
+        # 把当前一期按原来的 .txt 格式导出，评分行与评分阶段写入的一致
+        os.makedirs(folder, exist_ok=True)
+        with self.lock:
+            rows = self.conn.execute("SELECT * FROM articles WHERE published_at IS NULL ORDER BY id").fetchall()
+        for row in rows:
+            text = self.to_article(row).text
+            if row['score'] is not None:
+                rated_on = datetime.fromtimestamp(row['rated_at']).strftime("%Y-%m-%d %H:%M:%S")
+                text += f"\n\nArticle Score: {row['score']:g} out of 10\nRated on: {rated_on}"
+            with open(os.path.join(folder, row['filename']), 'w', encoding='utf-8') as f:
+                f.write(text)
+        print(f"Exported {len(rows)} articles to {folder}")
+
+    def close(self):
+        self.conn.close()
+
+def open_article_store():
+    # 各阶段使用同一份配置；ARTICLE_STORE_FILE 留空则沿用 articles_text/ 目录下的 .txt 文件
+    path = os.getenv("ARTICLE_STORE_FILE", "articles.db")
+    return ArticleStore(path) if path else None
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Query the article store")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    search_parser = subparsers.add_parser('search', help="full-text search over all stored articles (FTS5 query syntax)")
+    search_parser.add_argument('query')
+    search_parser.add_argument('--limit', type=int, default=20)
+    top_parser = subparsers.add_parser('top', help="highest-rated articles of the current edition")
+    top_parser.add_argument('--limit', type=int, default=int(os.getenv("TOP_ARTICLES", 5)))
+    export_parser = subparsers.add_parser('export', help="write the current edition as .txt files")
+    export_parser.add_argument('folder', nargs='?', default='articles_text')
+    args = parser.parse_args()
+
+    store = open_article_store()
+    if store is None:
+        parser.error("ARTICLE_STORE_FILE is empty, there is no article store")
+    if args.command == 'export':
+        store.export_text(args.folder)
+        return
+    articles = store.search(args.query, args.limit) if args.command == 'search' else store.top(args.limit)
+    for article in articles:
+        score = f"{article.score:g}" if article.score is not None else '-'
+        print(f"{score:>4}  {article.title}  {article.url}")
+
+if __name__ == "__main__":
+    main()
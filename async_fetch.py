@@ -0,0 +1,44 @@
+import time
+import asyncio
+import aiohttp
+import http_client
+
+class AsyncFetcher:
+    # 基于 aiohttp 的共享连接池：全局并发上限 + 每个主机的并发上限
+    def __init__(self, max_in_flight=50, per_host=4, timeout=http_client.HTTP_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.per_host = per_host
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.max_in_flight,
+            limit_per_host=self.per_host,
+            ttl_dns_cache=300
+        )
+        default_headers = {'User-Agent': http_client.HTTP_USER_AGENT} if http_client.HTTP_USER_AGENT else None
+        self.session = aiohttp.ClientSession(connector=connector, timeout=self.timeout, headers=default_headers)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.session.close()
+
+    async def get(self, url, headers=None, as_text=False):
+        # 返回 (状态码, 响应头, 内容)，as_text 为 True 时内容按响应编码解码为字符串
+        # 请求节奏（最短间隔、robots.txt Crawl-delay）与延迟统计和同步客户端共用 http_client
+        delay = await asyncio.to_thread(http_client.client.pacing_delay, url)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        start = time.perf_counter()
+        try:
+            async with self.session.get(url, headers=headers) as response:
+                if as_text:
+                    body = await response.text(errors='replace')
+                else:
+                    body = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            http_client.client.record(url, error=True)
+            raise
+        http_client.client.record(url, time.perf_counter() - start, error=response.status >= 400)
+        return response.status, response.headers, body
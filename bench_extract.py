@@ -0,0 +1,78 @@
+import os
+import csv
+import sys
+import time
+import hashlib
+import argparse
+import requests
+import http_client
+from html_extract import available_backends, extract_page, extract_page_stream
+
+def save_corpus(csv_file, corpus_dir, limit):
+    # 从 articles.csv 下载文章页面，保存为基准测试语料
+    os.makedirs(corpus_dir, exist_ok=True)
+    with open(csv_file, mode='r', encoding='utf-8') as file:
+        rows = list(csv.DictReader(file))[:limit]
+    for row in rows:
+        url = row['URL']
+        filename = hashlib.sha1(url.encode('utf-8')).hexdigest() + '.html'
+        try:
+            response = http_client.get(url)
+            response.raise_for_status()
+            with open(os.path.join(corpus_dir, filename), 'w', encoding='utf-8') as f:
+                f.write(response.text)
+            print(f"Saved {url}")
+        except requests.RequestException as e:
+            print(f"Error fetching {url}: {e}")
+
+def load_corpus(corpus_dir):
+    pages = []
+    for filename in sorted(os.listdir(corpus_dir)):
+        if filename.endswith(('.html', '.htm')):
+            with open(os.path.join(corpus_dir, filename), 'r', encoding='utf-8', errors='replace') as f:
+                pages.append(f.read())
+    return pages
+
+def chunked(html, size=16384):
+    for i in range(0, len(html), size):
+        yield html[i:i + size]
+
+def run_benchmark(pages, repeat):
+    # 每个后端解析整个语料 repeat 次，取最快一次
+    cases = [(backend, lambda html, backend=backend: extract_page(html, backend)) for backend in available_backends()]
+    # 增量模式：<article> 闭合后即停止解析
+    cases.append(('stream-early-stop', lambda html: extract_page_stream(chunked(html))))
+
+    total_bytes = sum(len(html.encode('utf-8')) for html in pages)
+    print(f"Corpus: {len(pages)} pages, {total_bytes / 1024 / 1024:.1f} MiB, best of {repeat}")
+    print(f"{'backend':<20}{'total (s)':>12}{'per page (ms)':>16}{'with text':>12}")
+    for name, extract in cases:
+        best = None
+        found = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            results = [extract(html) for html in pages]
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+            found = sum(1 for result in results if result['text'])
+        print(f"{name:<20}{best:>12.3f}{best / len(pages) * 1000:>16.2f}{found:>12}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark HTML extraction backends over a saved corpus of pages")
+    parser.add_argument('corpus_dir', help="directory of saved .html pages")
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--save-from', metavar='CSV', help="first download the pages listed in an articles.csv into corpus_dir")
+    parser.add_argument('--limit', type=int, default=100, help="maximum number of pages to download with --save-from")
+    args = parser.parse_args()
+
+    if args.save_from:
+        save_corpus(args.save_from, args.corpus_dir, args.limit)
+
+    pages = load_corpus(args.corpus_dir)
+    if not pages:
+        print(f"No .html pages found in {args.corpus_dir}")
+        sys.exit(1)
+    run_benchmark(pages, args.repeat)
+
+if __name__ == "__main__":
+    main()
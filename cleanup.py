@@ -1,7 +1,16 @@
 import os
 import shutil
 import zipfile
+import metrics
 from datetime import datetime
+from dotenv import load_dotenv
+from article_store import open_article_store
+from archive_store import ArchiveStore
+
+# Load environment variables
+load_dotenv()
+
+ARCHIVE_FORMAT = os.getenv('ARCHIVE_FORMAT', 'zip')  # zip (one zip per run) or cas (deduplicated blobs + per-run manifest)
 
 def zip_files_and_folders(zip_filename, items_to_zip):
     with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
@@ -30,15 +39,28 @@ def update_gitignore():
         if "archives/" not in existing_content:
             gitignore_file.write(gitignore_content)
 
+def link_or_copy(src, dst):
+    # The originals are removed right after archiving, so a hard link saves writing the data twice
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
 def copy_to_output_folder(output_folder, items_to_copy):
     os.makedirs(output_folder, exist_ok=True)
     for item in items_to_copy:
         if os.path.isdir(item):
-            shutil.copytree(item, os.path.join(output_folder, os.path.basename(item)))
+            shutil.copytree(item, os.path.join(output_folder, os.path.basename(item)), copy_function=link_or_copy)
         elif os.path.isfile(item):
-            shutil.copy2(item, output_folder)
+            link_or_copy(item, os.path.join(output_folder, os.path.basename(item)))
+
+def main(checkpoint=True):
+    # A pipeline run without checkpoints is a trial: its newsletter was never sent, so nothing is
+    # copied to output/, archived, or marked as published in the article store
+    if not checkpoint:
+        print("Checkpoints are off: leaving the generated files in place, nothing archived or published")
+        return
 
-def main():
     # List of items to zip and remove
     items = [
         "article_summaries",
@@ -46,11 +68,14 @@ def main():
         "high_rated_articles",
         "thumbnails",
         "article_ratings.json",
+        "rating_stats.json",
+        "http_stats.json",
         "article_summaries.json",
         "articles.csv",
         "newsletter.html",
         "titles_and_links.txt",
-        "newsletter.png"  # Added newsletter.png to the list
+        "newsletter.png",  # Added newsletter.png to the list
+        "newsletter_segments"
     ]
 
     # Create archives directory
@@ -63,20 +88,35 @@ def main():
 
     # Create output folder with current date and time
     output_folder = os.path.join("output", current_time)
-    items_to_copy = ["newsletter.html", "thumbnails", "titles_and_links.txt", "newsletter.png"]
+    items_to_copy = ["newsletter.html", "thumbnails", "titles_and_links.txt", "newsletter.png", "newsletter_segments"]
     copy_to_output_folder(output_folder, items_to_copy)
 
-    # Zip files and folders
-    print(f"Creating zip file: {zip_filename}")
-    zip_files_and_folders(zip_filename, items)
+    with metrics.timer('archive'):
+        if ARCHIVE_FORMAT == 'cas':
+            # Only files not already in the archive are compressed and written
+            archive_store = ArchiveStore(archives_dir)
+            archive_store.archive(current_time, items)
+            archive_store.prune()
+            zip_filename = os.path.join(archive_store.runs_dir, f"{current_time}.json")
+        else:
+            # Zip files and folders
+            print(f"Creating zip file: {zip_filename}")
+            zip_files_and_folders(zip_filename, items)
 
     # Remove original files and folders
     print("Removing original files and folders")
     remove_items(items)
 
+    # Close the current edition; the articles stay in the store for search
+    article_store = open_article_store()
+    if article_store:
+        print(f"Marked {article_store.publish()} articles in the article store as published")
+        article_store.close()
+
     # Update .gitignore
     update_gitignore()
 
+    metrics.report('cleanup')
     print(f"Cleanup complete. Archive created: {zip_filename}")
 
 if __name__ == "__main__":
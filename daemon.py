@@ -0,0 +1,193 @@
+import os
+import time
+import signal
+import http_client
+import metrics
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from feed_scheduler import FeedScheduler, CronSchedule
+from pipeline import load_stage
+
+# Load environment variables
+load_dotenv()
+
+NEWSLETTER_SCHEDULE = os.getenv('NEWSLETTER_SCHEDULE', '0 8 * * *')  # Cron expression (local time) for publishing the newsletter
+FEED_SCHEDULE_FILE = os.getenv('FEED_SCHEDULE_FILE', 'feed_schedule.json')
+FEED_MIN_INTERVAL_MINUTES = float(os.getenv('FEED_MIN_INTERVAL_MINUTES', 15))
+FEED_MAX_INTERVAL_HOURS = float(os.getenv('FEED_MAX_INTERVAL_HOURS', 24))
+FEED_DEFAULT_INTERVAL_MINUTES = float(os.getenv('FEED_DEFAULT_INTERVAL_MINUTES', 60))
+DAEMON_MAX_SLEEP = 60  # Seconds; bounds how long an OPML edit or a stop signal can go unnoticed
+
+class NewsletterDaemon:
+    # Long-running mode: polls each feed on its own adaptive schedule, extracts, rates and summarizes new
+    # entries as they arrive, and publishes the newsletter on the NEWSLETTER_SCHEDULE cron schedule
+    def __init__(self, opml_file='feeds.opml', articles_dir='articles_text', summaries_dir='article_summaries'):
+        self.opml_file = opml_file
+        self.opml_mtime = None
+        self.articles_dir = articles_dir
+        self.summaries_dir = summaries_dir
+        self.rss = load_stage('rss_digest.py')
+        self.rating = load_stage('rating-openai.py')
+        self.summarize = load_stage('summerize-high-rated.py')
+        self.newsletter = load_stage('make_newsletter.py')
+        self.render = load_stage('renderpng.py')
+        self.cleanup = load_stage('cleanup.py')
+        self.scheduler = FeedScheduler(FEED_SCHEDULE_FILE, FEED_MIN_INTERVAL_MINUTES * 60, FEED_MAX_INTERVAL_HOURS * 3600,
+                                       FEED_DEFAULT_INTERVAL_MINUTES * 60)
+        self.cron = CronSchedule(NEWSLETTER_SCHEDULE)
+        self.rated = {}  # filename -> Article rated since the last newsletter
+        self.summaries = {}  # filename -> summary of an article that made the current top list
+        # Entries already handed to extraction (link -> time), in case the dedup index is disabled; kept for
+        # DATE_RANGE_DAYS, after which the feed parser drops the entries anyway
+        self.seen_links = {}
+        self.stopping = False
+
+    def restore(self):
+        # Pick up articles rated before a restart; they stay in the current edition until the next newsletter's cleanup
+        if self.rating.article_store:
+            for article in self.rating.article_store.current():
+                if article.score is not None:
+                    self.rated[article.filename] = article
+                    if article.summary:
+                        self.summaries[article.filename] = article.summary
+        elif os.path.isdir(self.articles_dir):
+            for article in self.rating.load_articles(self.articles_dir):
+                match = self.rating.extract_score(article.text)
+                if match:
+                    article.score = float(match.group(1))
+                    self.rated[article.filename] = article
+        if self.rated:
+            print(f"Restored {len(self.rated)} rated articles from {self.articles_dir}")
+
+    def reload_feeds(self):
+        # Watch feeds.opml and reschedule when it changes
+        mtime = os.path.getmtime(self.opml_file)
+        if mtime != self.opml_mtime:
+            self.opml_mtime = mtime
+            urls = self.rss.extract_urls_from_opml(self.opml_file)
+            self.scheduler.sync(urls)
+            print(f"Scheduling {len(urls)} feeds from {self.opml_file}")
+
+    def poll(self, url):
+        hints = {}
+        entries = self.rss.fetch_articles_from_rss(url, hints)
+        interval = self.scheduler.reschedule(url, hints)
+        if interval:
+            print(f"Next poll of {url} in {interval / 60:.0f} min")
+        return entries
+
+    def top_articles(self):
+        return sorted(self.rated.values(), key=lambda article: article.score, reverse=True)[:self.rating.TOP_ARTICLES]
+
+    def process_entries(self, entries):
+        now = time.time()
+        cutoff = now - self.rss.DATE_RANGE_DAYS * 86400
+        self.seen_links = {link: seen_at for link, seen_at in self.seen_links.items() if seen_at >= cutoff}
+        rows = [{'Title': entry['title'], 'URL': entry['link'], 'Date': entry['date']} for entry in entries if entry['link'] not in self.seen_links]
+        self.seen_links.update((row['URL'], now) for row in rows)
+        if not rows:
+            return
+        saved = self.rss.process_rows(rows, self.articles_dir, self.rss.KEYWORDS)
+        # Entries whose download failed are retried when their feed is fetched in full again
+        for link in self.rss.failed_urls:
+            self.seen_links.pop(link, None)
+        # Pre-ranking sees only this poll's entries, so PRERANK_MIN_SIMILARITY does most of the filtering here
+        to_rate = self.rating.prerank_articles(saved) if self.rating.RATING_PRERANK and saved else saved
+        with ThreadPoolExecutor(max_workers=self.rating.RATING_WORKERS) as executor:
+            list(executor.map(lambda article: self.rating.rate_article(article, self.articles_dir), to_rate))
+        if self.rating.RATING_PRERANK:
+            self.rating.record_prerank_scores(to_rate)
+        for article in saved:
+            if article.score is not None:
+                self.rated[article.filename] = article
+        print(f"{len(rows)} new entries, {len(saved)} saved, {len(self.rated)} rated articles waiting for the next newsletter")
+        self.update_summaries()
+
+    def update_summaries(self):
+        # Summarize articles as soon as they enter the current top list, so publishing does not wait on the API
+        pending = [article for article in self.top_articles() if article.filename not in self.summaries]
+        if not pending:
+            return
+        if self.summarize.writes_text:
+            os.makedirs(self.summaries_dir, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=self.summarize.SUMMARY_WORKERS) as executor:
+            results = list(executor.map(lambda article: self.summarize.summarize_article(article, self.summaries_dir), pending))
+        for article, result in zip(pending, results):
+            if result:
+                self.summaries[article.filename] = result
+
+    def publish(self):
+        top = self.top_articles()
+        if not top:
+            print("No rated articles since the last newsletter, skipping this edition")
+            return
+        self.update_summaries()
+        # The previous edition's report is kept until now; polling and rating since then are filed
+        # as one 'daemon' stage of this edition's report
+        metrics.clear_report()
+        metrics.report('daemon')
+        summaries = {article.filename: self.summaries[article.filename] for article in top if article.filename in self.summaries}
+        result = self.newsletter.run(summaries)
+        self.render.run((result.html_path,))
+        http_client.report('daemon')
+        self.cleanup.main()
+        self.rated.clear()
+        self.summaries.clear()
+        metrics.metrics.reset()
+
+    def stop(self, signum, frame):
+        print("Stopping after the current cycle...")
+        self.stopping = True
+
+    def run_forever(self):
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGTERM, self.stop)
+        self.restore()
+        self.reload_feeds()
+        next_newsletter = self.cron.next_timestamp()
+        print(f"Next newsletter at {time.strftime('%Y-%m-%d %H:%M', time.localtime(next_newsletter))}")
+
+        with ThreadPoolExecutor(max_workers=self.rss.THREADS) as poll_executor:
+            while not self.stopping:
+                # Only the feeds that are due are touched, however many feeds.opml lists
+                due = self.scheduler.pop_due()
+                if due:
+                    try:
+                        entries = [entry for feed_entries in poll_executor.map(self.poll, due) for entry in feed_entries]
+                        self.process_entries(entries)
+                        self.rss.commit_feed_states()
+                    except Exception as e:
+                        # The feeds stay uncommitted, so their entries are fetched and processed again
+                        self.rss.discard_feed_states()
+                        print(f"Error processing new entries: {e}")
+                    self.rss.feed_cache.save()
+                    self.scheduler.save()
+
+                if time.time() >= next_newsletter:
+                    try:
+                        self.publish()
+                    except Exception as e:
+                        print(f"Error publishing newsletter: {e}")
+                    next_newsletter = self.cron.next_timestamp()
+                    self.scheduler.report()
+                    print(f"Next newsletter at {time.strftime('%Y-%m-%d %H:%M', time.localtime(next_newsletter))}")
+
+                try:
+                    self.reload_feeds()
+                except Exception as e:
+                    print(f"Error reloading {self.opml_file}: {e}")
+
+                wake = min(self.scheduler.next_due() or next_newsletter, next_newsletter, time.time() + DAEMON_MAX_SLEEP)
+                while not self.stopping and time.time() < wake:
+                    time.sleep(min(1, wake - time.time()))
+
+        self.rss.feed_cache.save()
+        self.scheduler.save()
+        if self.rss.dedup_index:
+            self.rss.dedup_index.close()
+
+def run_daemon(opml_file='feeds.opml'):
+    NewsletterDaemon(opml_file).run_forever()
+
+if __name__ == "__main__":
+    run_daemon()
@@ -0,0 +1,146 @@
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import Counter
+from urllib.parse import urlparse, urlunparse, parse_qsl, urlencode
+
+# 常见的跟踪参数，规范化 URL 时去除
+TRACKING_PARAMS = {'fbclid', 'gclid', 'dclid', 'msclkid', 'yclid', 'igshid', 'mc_cid', 'mc_eid', 'ref', 'ref_src', 'spm', '_hsenc', '_hsmi'}
+TRACKING_PREFIXES = ('utm_',)
+
+# 中日韩字符逐字切分，其余按单词切分
+TOKEN_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]|[^\W_]+')
+
+FINGERPRINT_BITS = 64
+BAND_BITS = 16
+
+def canonicalize_url(url):
+    # 统一协议、主机名大小写，去掉 www、默认端口、锚点和跟踪参数
+    parsed = urlparse(url.strip())
+    scheme = 'https' if parsed.scheme in ('http', 'https', '') else parsed.scheme
+    host = (parsed.hostname or '').lower()
+    if host.startswith('www.'):
+        host = host[4:]
+    if parsed.port and parsed.port not in (80, 443):
+        host = f"{host}:{parsed.port}"
+    path = parsed.path.rstrip('/') or '/'
+    query = [
+        (key, value) for key, value in parse_qsl(parsed.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith(TRACKING_PREFIXES)
+    ]
+    return urlunparse((scheme, host, path, '', urlencode(sorted(query)), ''))
+
+def simhash(text):
+    # 基于三元组 shingle 的 64 位 SimHash 指纹
+    tokens = TOKEN_PATTERN.findall(text.lower())
+    shingles = Counter(' '.join(tokens[i:i + 3]) for i in range(max(len(tokens) - 2, 1)))
+    vector = [0] * FINGERPRINT_BITS
+    for shingle, weight in shingles.items():
+        digest = hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest()
+        value = int.from_bytes(digest, 'big')
+        for i in range(FINGERPRINT_BITS):
+            vector[i] += weight if value >> i & 1 else -weight
+    return sum(1 << i for i in range(FINGERPRINT_BITS) if vector[i] > 0)
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+def split_bands(fingerprint):
+    mask = (1 << BAND_BITS) - 1
+    return [fingerprint >> (i * BAND_BITS) & mask for i in range(FINGERPRINT_BITS // BAND_BITS)]
+
+def to_signed(value):
+    # SQLite 的 INTEGER 是有符号 64 位整数
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def to_unsigned(value):
+    return value + (1 << 64) if value < 0 else value
+
+class DedupIndex:
+    # 跨运行的文章去重索引：规范化 URL + SimHash 内容指纹
+    def __init__(self, path, max_distance=3, retention_days=30):
+        self.max_distance = max_distance
+        self.lock = threading.Lock()
+        self.persist = True  # False 时本次记录只在当前连接中可见，discard() 后丢弃
+        self.in_flight = set()
+        self.skipped_urls = 0
+        self.skipped_duplicates = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS articles (
+                url TEXT PRIMARY KEY,
+                fingerprint INTEGER,
+                band0 INTEGER, band1 INTEGER, band2 INTEGER, band3 INTEGER,
+                seen_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_band0 ON articles (band0);
+            CREATE INDEX IF NOT EXISTS idx_band1 ON articles (band1);
+            CREATE INDEX IF NOT EXISTS idx_band2 ON articles (band2);
+            CREATE INDEX IF NOT EXISTS idx_band3 ON articles (band3);
+        """)
+        # 清理超过保留期限的记录
+        self.conn.execute("DELETE FROM articles WHERE seen_at < ?", (time.time() - retention_days * 86400,))
+        self.conn.commit()
+
+    def claim_url(self, url):
+        # 返回 False 表示该 URL 已处理过或正在被其他线程处理
+        canonical_url = canonicalize_url(url)
+        with self.lock:
+            seen = self.conn.execute("SELECT 1 FROM articles WHERE url = ?", (canonical_url,)).fetchone()
+            if seen or canonical_url in self.in_flight:
+                self.skipped_urls += 1
+                return False
+            self.in_flight.add(canonical_url)
+            return True
+
+    def release_url(self, url):
+        # 处理失败时释放 URL，下次运行可以重试
+        with self.lock:
+            self.in_flight.discard(canonicalize_url(url))
+
+    def mark_seen(self, url):
+        # 记录没有可提取正文的文章（无 <article>、无字幕、404 等），之后不再重复下载；没有指纹，不参与近似重复比较
+        canonical_url = canonicalize_url(url)
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO articles (url, seen_at) VALUES (?, ?)", (canonical_url, time.time()))
+            if self.persist:
+                self.conn.commit()
+            self.in_flight.discard(canonical_url)
+
+    def check_and_record(self, url, fingerprint):
+        # 查找近似重复的文章并记录当前文章，返回重复文章的 URL（没有则为 None）
+        canonical_url = canonicalize_url(url)
+        bands = split_bands(fingerprint)
+        with self.lock:
+            rows = self.conn.execute(
+                "SELECT url, fingerprint FROM articles WHERE band0 = ? OR band1 = ? OR band2 = ? OR band3 = ?",
+                bands
+            ).fetchall()
+            duplicate = None
+            for other_url, other_fingerprint in rows:
+                if other_url != canonical_url and hamming_distance(fingerprint, to_unsigned(other_fingerprint)) <= self.max_distance:
+                    duplicate = other_url
+                    self.skipped_duplicates += 1
+                    break
+            self.conn.execute(
+                "INSERT OR REPLACE INTO articles (url, fingerprint, band0, band1, band2, band3, seen_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (canonical_url, to_signed(fingerprint), *bands, time.time())
+            )
+            if self.persist:
+                self.conn.commit()
+            self.in_flight.discard(canonical_url)
+            return duplicate
+
+    def discard(self):
+        # 丢弃 persist 为 False 期间的记录
+        with self.lock:
+            self.conn.rollback()
+            self.in_flight.clear()
+
+    def report(self):
+        print(f"Dedup index: skipped {self.skipped_urls} already-seen URLs, {self.skipped_duplicates} near-duplicates")
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,74 @@
+import os
+import json
+import hashlib
+import threading
+
+class FeedCache:
+    # 按订阅源 URL 持久化 ETag、Last-Modified 和内容哈希，用于条件请求
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.hits = 0  # 304 或内容哈希未变化，跳过解析
+        self.misses = 0  # 订阅源有更新，需要重新解析
+        self.feeds = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError) as e:
+            print(f"Error loading feed cache {self.path}: {e}")
+            return {}
+
+    def request_headers(self, url):
+        # 根据上次记录的状态构造条件请求头
+        with self.lock:
+            state = self.feeds.get(url, {})
+        headers = {}
+        if state.get('etag'):
+            headers['If-None-Match'] = state['etag']
+        if state.get('last_modified'):
+            headers['If-Modified-Since'] = state['last_modified']
+        return headers
+
+    def check(self, url, status_code, headers, content):
+        # 只做比较，返回 (是否未变化, 新状态)。新状态要等订阅源解析完、其中的文章都下载成功后
+        # 再由调用方 commit，否则失败的条目会因为订阅源“未变化”而再也不被重试
+        with self.lock:
+            if status_code == 304:
+                self.hits += 1
+                return True, None
+            if status_code != 200:
+                # 错误响应不记录状态，交给调用方按原逻辑处理
+                self.misses += 1
+                return False, None
+
+            content_hash = hashlib.sha256(content).hexdigest()
+            state = self.feeds.get(url, {})
+            unchanged = state.get('hash') == content_hash
+            if unchanged:
+                self.hits += 1
+            else:
+                self.misses += 1
+            return unchanged, {
+                'etag': headers.get('ETag') or state.get('etag'),
+                'last_modified': headers.get('Last-Modified') or state.get('last_modified'),
+                'hash': content_hash
+            }
+
+    def commit(self, url, state):
+        with self.lock:
+            self.feeds[url] = state
+
+    def save(self):
+        with self.lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(self.feeds, file, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, self.path)
+
+    def report(self):
+        total = self.hits + self.misses
+        print(f"Feed cache: {self.hits} hits, {self.misses} misses ({total} feeds checked)")
@@ -0,0 +1,199 @@
+import os
+import json
+import time
+import heapq
+import random
+import threading
+from datetime import datetime, timedelta
+
+# sy:updatePeriod 对应的秒数
+UPDATE_PERIODS = {'hourly': 3600, 'daily': 86400, 'weekly': 7 * 86400, 'monthly': 30 * 86400, 'yearly': 365 * 86400}
+
+def hinted_interval(hints):
+    # 订阅源声明的更新间隔：sy:updatePeriod / sy:updateFrequency
+    period = UPDATE_PERIODS.get((hints.get('update_period') or '').strip().lower())
+    if not period:
+        return None
+    try:
+        frequency = max(1, int(hints.get('update_frequency') or 1))
+    except ValueError:
+        frequency = 1
+    return period / frequency
+
+def observed_interval(entry_times, now):
+    # 按最近条目的发布间隔估算发文频率；最新条目已经比平均间隔更旧时，说明订阅源在放缓
+    times = sorted((t for t in entry_times if t <= now), reverse=True)[:10]
+    if len(times) < 2:
+        return None
+    gaps = sorted(earlier - later for earlier, later in zip(times, times[1:]))
+    gap = max(gaps[len(gaps) // 2], 60)
+    return max(gap, now - times[0])
+
+class FeedScheduler:
+    # 每个订阅源各自的轮询间隔，按下次轮询时间放在小顶堆中；每轮只取出到期的订阅源，开销与订阅源总数无关
+    def __init__(self, path, min_interval=900, max_interval=86400, default_interval=3600):
+        self.path = path
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_interval = default_interval
+        self.lock = threading.Lock()
+        self.feeds = self._load()  # url -> {'interval', 'base_interval', 'next_poll', 'failures', 'last_entry'}
+        self.heap = []
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading feed schedule {self.path}: {e}")
+            return {}
+
+    def sync(self, urls, now=None):
+        # 与 OPML 中的订阅源保持一致：新订阅源在一个默认间隔内随机错开首次轮询，已删除的订阅源不再调度
+        now = now or time.time()
+        with self.lock:
+            for url in list(self.feeds):
+                if url not in urls:
+                    del self.feeds[url]
+            for url in urls:
+                if url not in self.feeds:
+                    self.feeds[url] = {'interval': self.default_interval, 'base_interval': self.default_interval,
+                                       'next_poll': now + random.uniform(0, min(60, self.default_interval)),
+                                       'failures': 0, 'last_entry': None}
+            self.heap = [(state['next_poll'], url) for url, state in self.feeds.items()]
+            heapq.heapify(self.heap)
+
+    def next_due(self):
+        with self.lock:
+            return self.heap[0][0] if self.heap else None
+
+    def pop_due(self, now=None):
+        now = now or time.time()
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                next_poll, url = heapq.heappop(self.heap)
+                state = self.feeds.get(url)
+                # 堆中过期的条目（订阅源已删除或已改期）直接丢弃
+                if state and state['next_poll'] == next_poll:
+                    due.append(url)
+        return due
+
+    def compute_interval(self, state, hints, now):
+        # base_interval 是最近一次成功轮询后的间隔，出错期间不变，退避与放慢都以它为基准
+        base = state.get('base_interval', state['interval'])
+        if hints.get('error'):
+            # 出错时指数退避：连续第 n 次出错为 base × 2^n
+            return base * 2 ** min(state['failures'], 5)
+        entry_times = hints.get('entry_times')
+        if not entry_times:
+            # 订阅源未变化（304 或内容哈希相同）或没有带日期的条目，逐步放慢
+            interval = base * 1.5
+        else:
+            newest = max(entry_times)
+            observed = observed_interval(entry_times, now)
+            if observed:
+                # 每个预期的发文间隔内轮询两次
+                interval = observed / 2
+            else:
+                interval = hinted_interval(hints) or self.default_interval
+            if state['last_entry'] and newest <= state['last_entry']:
+                # 没有新条目
+                interval = max(interval, base * 1.5)
+            state['last_entry'] = newest
+        try:
+            # ttl 是允许缓存的分钟数，不必比它更频繁地轮询
+            interval = max(interval, float(hints.get('ttl') or 0) * 60)
+        except ValueError:
+            pass
+        return interval
+
+    def reschedule(self, url, hints, now=None):
+        # hints 来自 rss_digest.fetch_articles_from_rss；订阅源未变化时为空字典
+        now = now or time.time()
+        with self.lock:
+            state = self.feeds.get(url)
+            if state is None:
+                return None
+            state['failures'] = state['failures'] + 1 if hints.get('error') else 0
+            interval = self.compute_interval(state, hints, now)
+            state['interval'] = min(max(interval, self.min_interval), self.max_interval)
+            if not hints.get('error'):
+                state['base_interval'] = state['interval']
+            # 少量抖动，避免间隔相同的订阅源总在同一时刻到期
+            state['next_poll'] = now + state['interval'] * random.uniform(0.95, 1.05)
+            heapq.heappush(self.heap, (state['next_poll'], url))
+            return state['interval']
+
+    def save(self):
+        with self.lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.feeds, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, self.path)
+
+    def report(self):
+        with self.lock:
+            intervals = sorted(state['interval'] for state in self.feeds.values())
+        if intervals:
+            print(f"Feed schedule: {len(intervals)} feeds, polling every {intervals[0] / 60:.0f}-{intervals[-1] / 60:.0f} min "
+                  f"(median {intervals[len(intervals) // 2] / 60:.0f} min)")
+
+def parse_cron_field(field, low, high):
+    # 支持 *、数字、a-b 范围、逗号列表和 /n 步长
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(value) for value in part.split('-'))
+        else:
+            start = end = int(part)
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronSchedule:
+    # 五段式 cron 表达式：分 时 日 月 周（周日为 0 或 7）；日和周同时受限时满足任一即可，与 cron 一致
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Invalid cron expression: {expression}")
+        self.expression = expression
+        self.minutes = parse_cron_field(fields[0], 0, 59)
+        self.hours = parse_cron_field(fields[1], 0, 23)
+        self.days = parse_cron_field(fields[2], 1, 31)
+        self.months = parse_cron_field(fields[3], 1, 12)
+        self.weekdays = {day % 7 for day in parse_cron_field(fields[4], 0, 7)}
+        self.any_day = fields[2] == '*'
+        self.any_weekday = fields[4] == '*'
+
+    def day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment):
+        # 返回 moment 之后第一个匹配的时间（本地时间），按天、小时、分钟逐级跳过
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 4)
+        while candidate < limit:
+            if candidate.month not in self.months or not self.day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hours:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression never matches: {self.expression}")
+
+    def next_timestamp(self, now=None):
+        return self.next_after(datetime.fromtimestamp(now or time.time())).timestamp()
@@ -0,0 +1,216 @@
+from collections import defaultdict
+from html.parser import HTMLParser
+
+from bs4 import BeautifulSoup
+
+# 可选的 C 实现解析器，未安装时自动回退到 BeautifulSoup
+try:
+    from selectolax.parser import HTMLParser as SelectolaxParser
+except ImportError:
+    SelectolaxParser = None
+
+try:
+    import lxml.html
+except ImportError:
+    lxml = None
+
+# 过滤广告图片时使用的关键字
+AD_KEYWORDS = ['ad', 'banner', 'sponsor']
+
+# 没有 <article> 标签时，正文段落至少需要的字符数
+FALLBACK_MIN_CHARS = 300
+
+VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'track', 'wbr'}
+
+def available_backends():
+    backends = ['bs4', 'stream']
+    if lxml is not None:
+        backends.append('lxml')
+    if SelectolaxParser is not None:
+        backends.append('selectolax')
+    return backends
+
+def resolve_backend(backend):
+    if backend and backend != 'auto':
+        return backend
+    if SelectolaxParser is not None:
+        return 'selectolax'
+    if lxml is not None:
+        return 'lxml'
+    return 'bs4'
+
+def is_ad_image(src):
+    return any(keyword in src.lower() for keyword in AD_KEYWORDS)
+
+def pick_main_text(paragraphs):
+    # 类似 readability 的启发式：选出段落文本总量最多的父元素作为正文
+    groups = defaultdict(list)
+    for parent, text in paragraphs:
+        if text.strip():
+            groups[parent].append(text)
+    if not groups:
+        return None
+    best = max(groups.values(), key=lambda texts: sum(len(text) for text in texts))
+    text = '\n'.join(best)
+    return text if len(text) >= FALLBACK_MIN_CHARS else None
+
+def extract_with_bs4(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    result = {'text': None, 'og_image': None, 'first_image': None}
+    article = soup.find('article')
+    if article:
+        result['text'] = article.get_text()
+    else:
+        result['text'] = pick_main_text((id(p.parent), p.get_text()) for p in soup.find_all('p'))
+    og_image = soup.find('meta', property='og:image')
+    if og_image and og_image.get('content'):
+        result['og_image'] = og_image['content']
+    for img in soup.find_all('img'):
+        src = img.get('src')
+        if src and not is_ad_image(src):
+            result['first_image'] = src
+            break
+    return result
+
+def extract_with_lxml(html):
+    try:
+        doc = lxml.html.fromstring(html)
+    except ValueError:
+        # 带编码声明的字符串需要先编码为字节
+        doc = lxml.html.fromstring(html.encode('utf-8'))
+    result = {'text': None, 'og_image': None, 'first_image': None}
+    article = doc.find('.//article')
+    if article is not None:
+        result['text'] = article.text_content()
+    else:
+        result['text'] = pick_main_text((p.getparent(), p.text_content()) for p in doc.iter('p'))
+    og_image = doc.xpath('//meta[@property="og:image"]/@content')
+    if og_image:
+        result['og_image'] = og_image[0]
+    for img in doc.iter('img'):
+        src = img.get('src')
+        if src and not is_ad_image(src):
+            result['first_image'] = src
+            break
+    return result
+
+def extract_with_selectolax(html):
+    tree = SelectolaxParser(html)
+    result = {'text': None, 'og_image': None, 'first_image': None}
+    article = tree.css_first('article')
+    if article is not None:
+        result['text'] = article.text(separator='')
+    else:
+        result['text'] = pick_main_text((p.parent.mem_id, p.text(separator='')) for p in tree.css('p'))
+    og_image = tree.css_first('meta[property="og:image"]')
+    if og_image is not None and og_image.attributes.get('content'):
+        result['og_image'] = og_image.attributes['content']
+    for img in tree.css('img'):
+        src = img.attributes.get('src')
+        if src and not is_ad_image(src):
+            result['first_image'] = src
+            break
+    return result
+
+class StreamingExtractor(HTMLParser):
+    # 增量解析器：边接收边解析，<article> 闭合（或找到图片）后即可停止
+    # stop_on: 'article'、'image'（og:image 或正文第一张图）、'first_image' 或 'images'（两者都找到）
+    # keyword_scan: 可选的 KeywordScan，<article> 内的文本在解析时逐段送入，命中关键字后不再扫描
+    def __init__(self, stop_on='article', keyword_scan=None):
+        super().__init__(convert_charrefs=True)
+        self.stop_on = stop_on
+        self.keyword_scan = keyword_scan
+        self.og_image = None
+        self.first_image = None
+        self.in_body = False
+        self.article_depth = 0
+        self.article_closed = False
+        self.article_parts = []
+        self.stack = []  # (标签名, 元素编号)
+        self.element_count = 0
+        self.paragraph = None  # (父元素编号, 文本片段)
+        self.paragraphs = []
+
+    @property
+    def done(self):
+        if self.stop_on == 'image':
+            return bool(self.og_image or (self.in_body and self.first_image))
+        if self.stop_on == 'first_image':
+            return bool(self.first_image)
+        if self.stop_on == 'images':
+            return bool(self.og_image and self.first_image)
+        return self.article_closed
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'body':
+            self.in_body = True
+        elif tag == 'meta' and attrs.get('property') == 'og:image' and attrs.get('content'):
+            self.og_image = self.og_image or attrs['content']
+        elif tag == 'img' and not self.first_image:
+            src = attrs.get('src')
+            if src and not is_ad_image(src):
+                self.first_image = src
+        elif tag == 'article' and not self.article_closed:
+            self.article_depth += 1
+        elif tag == 'p':
+            parent = self.stack[-1][1] if self.stack else None
+            self.paragraph = (parent, [])
+        if tag not in VOID_TAGS:
+            self.stack.append((tag, self.element_count))
+            self.element_count += 1
+
+    def handle_endtag(self, tag):
+        if tag == 'article' and self.article_depth:
+            self.article_depth -= 1
+            if not self.article_depth:
+                self.article_closed = True
+        elif tag == 'p' and self.paragraph:
+            self.paragraphs.append((self.paragraph[0], ''.join(self.paragraph[1])))
+            self.paragraph = None
+        # 容错处理未闭合的标签：弹出到匹配的开始标签为止
+        for i in range(len(self.stack) - 1, -1, -1):
+            if self.stack[i][0] == tag:
+                del self.stack[i:]
+                break
+
+    def handle_data(self, data):
+        if self.article_depth:
+            self.article_parts.append(data)
+            if self.keyword_scan:
+                self.keyword_scan.feed(data)
+        if self.paragraph:
+            self.paragraph[1].append(data)
+
+    def result(self):
+        # keyword_match 只在正文取自 <article> 时有效；按段落启发式提取的正文为 None，需要调用方自行匹配
+        keyword_match = None
+        if self.article_parts:
+            text = ''.join(self.article_parts)
+            if self.keyword_scan:
+                keyword_match = self.keyword_scan.matched
+        else:
+            text = pick_main_text(self.paragraphs)
+        return {'text': text, 'og_image': self.og_image, 'first_image': self.first_image, 'keyword_match': keyword_match}
+
+def extract_page_stream(chunks, stop_on='article', keyword_scan=None):
+    # chunks 为逐块到达的 HTML 文本，满足停止条件后不再读取剩余内容
+    parser = StreamingExtractor(stop_on, keyword_scan)
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            break
+    else:
+        parser.close()
+    return parser.result()
+
+def extract_page(html, backend=None):
+    # 返回 {'text': 正文, 'og_image': og:image 地址, 'first_image': 第一张非广告图片}
+    backend = resolve_backend(backend)
+    if backend == 'selectolax' and SelectolaxParser is not None:
+        return extract_with_selectolax(html)
+    if backend == 'lxml' and lxml is not None:
+        return extract_with_lxml(html)
+    if backend == 'stream':
+        return extract_page_stream([html])
+    return extract_with_bs4(html)
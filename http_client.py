@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+import requests
+import metrics
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+# 加载环境变量
+load_dotenv()
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 10))
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 2))  # GET/HEAD 遇到网络错误、429 或 5xx 时的重试次数
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", 32))  # 保持的主机连接池数量及每个主机的最大连接数
+HTTP_PER_HOST = int(os.getenv("HTTP_PER_HOST", 4))  # 同一主机的并发请求上限
+HTTP_HOST_MIN_INTERVAL = float(os.getenv("HTTP_HOST_MIN_INTERVAL", 0))  # 同一主机两次请求之间的最短间隔（秒）
+HTTP_RESPECT_ROBOTS = os.getenv("HTTP_RESPECT_ROBOTS", "true").lower() == "true"  # 遵守 robots.txt 中的 Crawl-delay
+HTTP_MAX_CRAWL_DELAY = float(os.getenv("HTTP_MAX_CRAWL_DELAY", 30))  # Crawl-delay 的上限（秒）
+HTTP_USER_AGENT = os.getenv("HTTP_USER_AGENT", "")  # 留空则使用 requests 默认的 User-Agent
+HTTP_STATS_FILE = os.getenv("HTTP_STATS_FILE", "http_stats.json")  # 留空则不导出
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+class HostState:
+    # 单个主机的并发槽位、请求节奏、robots.txt 与延迟统计
+    def __init__(self, per_host):
+        self.semaphore = threading.BoundedSemaphore(per_host)
+        self.lock = threading.Lock()
+        self.robots_lock = threading.Lock()
+        self.next_start = 0.0
+        self.crawl_delay = None  # None 表示尚未读取 robots.txt
+        self.latencies = []
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.wait_seconds = 0.0
+
+class HttpClient:
+    # 所有脚本共用的 HTTP 客户端：一个带连接池的 Session（keep-alive），按主机限制并发与请求节奏，
+    # 遵守 robots.txt 的 Crawl-delay，统一超时与重试，并记录每个主机的延迟
+    def __init__(self, timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES, pool_size=HTTP_POOL_SIZE, per_host=HTTP_PER_HOST,
+                 min_interval=HTTP_HOST_MIN_INTERVAL, respect_robots=HTTP_RESPECT_ROBOTS, user_agent=HTTP_USER_AGENT):
+        self.timeout = timeout
+        self.retries = retries
+        self.per_host = per_host
+        self.min_interval = min_interval
+        self.respect_robots = respect_robots
+        self.user_agent = user_agent
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if user_agent:
+            self.session.headers['User-Agent'] = user_agent
+        self.lock = threading.Lock()
+        self.hosts = {}
+
+    def host_state(self, url):
+        host = urlparse(url).netloc.lower()
+        with self.lock:
+            if host not in self.hosts:
+                self.hosts[host] = HostState(self.per_host)
+            return host, self.hosts[host]
+
+    def crawl_delay(self, url):
+        # 每个主机只读取一次 robots.txt；读取失败视为没有限制
+        _, state = self.host_state(url)
+        with state.robots_lock:
+            if state.crawl_delay is None:
+                parsed = urlparse(url)
+                delay = 0.0
+                try:
+                    response = self.session.get(f"{parsed.scheme}://{parsed.netloc}/robots.txt", timeout=self.timeout)
+                    if response.status_code == 200:
+                        parser = RobotFileParser()
+                        parser.parse(response.text.splitlines())
+                        agent = self.user_agent or '*'
+                        delay = float(parser.crawl_delay(agent) or 0)
+                        rate = parser.request_rate(agent)
+                        if rate and rate.requests:
+                            delay = max(delay, rate.seconds / rate.requests)
+                except (requests.RequestException, ValueError):
+                    pass
+                state.crawl_delay = min(delay, HTTP_MAX_CRAWL_DELAY)
+                if state.crawl_delay:
+                    print(f"Honouring crawl delay of {state.crawl_delay:g}s for {parsed.netloc}")
+            return state.crawl_delay
+
+    def pacing_delay(self, url):
+        # 预约本主机的下一个请求时刻，返回需要等待的秒数（同步与异步抓取共用）
+        interval = self.min_interval
+        if self.respect_robots:
+            interval = max(interval, self.crawl_delay(url))
+        _, state = self.host_state(url)
+        with state.lock:
+            now = time.monotonic()
+            start = max(now, state.next_start)
+            state.next_start = start + interval
+            state.wait_seconds += start - now
+        return start - now
+
+    def record(self, url, latency=None, error=False, retry=False):
+        metrics.count('http_requests')
+        if error:
+            metrics.count('http_errors')
+        if retry:
+            metrics.count('http_retries')
+        _, state = self.host_state(url)
+        with state.lock:
+            state.requests += 1
+            if error:
+                state.errors += 1
+            if retry:
+                state.retries += 1
+            if latency is not None:
+                state.latencies.append(latency)
+
+    @contextmanager
+    def slot(self, url, polite=True):
+        # polite 为 False（如 LLM API）时不限制并发、不读取 robots.txt，只共用连接池与统计
+        if not polite:
+            yield
+            return
+        _, state = self.host_state(url)
+        with state.semaphore:
+            delay = self.pacing_delay(url)
+            if delay > 0:
+                time.sleep(delay)
+            yield
+
+    def backoff_delay(self, attempt, response=None):
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), 60)
+            except ValueError:
+                pass
+        return min(30, 2 ** attempt) * random.uniform(0.5, 1)
+
+    def request(self, method, url, retries=None, polite=True, timeout=None, **kwargs):
+        # 只有幂等请求默认重试；调用方自行处理重试时传 retries=0
+        if retries is None:
+            retries = self.retries if method.upper() in ('GET', 'HEAD') else 0
+        for attempt in range(retries + 1):
+            with self.slot(url, polite):
+                start = time.perf_counter()
+                try:
+                    response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+                except (requests.ConnectionError, requests.Timeout):
+                    self.record(url, error=True, retry=attempt < retries)
+                    if attempt == retries:
+                        raise
+                    time.sleep(self.backoff_delay(attempt))
+                    continue
+            retry = response.status_code in RETRY_STATUS and attempt < retries
+            self.record(url, time.perf_counter() - start, error=response.status_code >= 400, retry=retry)
+            if not retry:
+                return response
+            delay = self.backoff_delay(attempt, response)
+            response.close()
+            time.sleep(delay)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    @contextmanager
+    def stream(self, url, **kwargs):
+        # 流式读取时一直占用本主机的并发槽位，直到响应关闭
+        with self.slot(url):
+            start = time.perf_counter()
+            try:
+                response = self.session.get(url, timeout=kwargs.pop('timeout', self.timeout), stream=True, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                self.record(url, error=True)
+                raise
+            self.record(url, time.perf_counter() - start, error=response.status_code >= 400)
+            try:
+                yield response
+            finally:
+                response.close()
+
+    def stats(self):
+        with self.lock:
+            hosts = dict(self.hosts)
+        result = {}
+        for host, state in hosts.items():
+            with state.lock:
+                latencies = sorted(state.latencies)
+                if not state.requests:
+                    continue
+                result[host] = {
+                    "requests": state.requests,
+                    "errors": state.errors,
+                    "retries": state.retries,
+                    "crawl_delay": state.crawl_delay or 0,
+                    "wait_seconds": round(state.wait_seconds, 3),
+                    "latency_seconds": {
+                        "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0,
+                        "p50": round(latencies[len(latencies) // 2], 3) if latencies else 0,
+                        "p95": round(latencies[int(len(latencies) * 0.95)], 3) if latencies else 0,
+                        "max": round(latencies[-1], 3) if latencies else 0
+                    }
+                }
+        return result
+
+    def reset_stats(self):
+        with self.lock:
+            hosts = list(self.hosts.values())
+        for state in hosts:
+            with state.lock:
+                state.latencies = []
+                state.requests = state.errors = state.retries = 0
+                state.wait_seconds = 0.0
+
+    def report(self, label, path=HTTP_STATS_FILE):
+        # 打印请求最多的主机，并把本阶段的统计写入 http_stats.json 中对应的部分，然后清零
+        stats = self.stats()
+        if not stats:
+            return
+        total = sum(host['requests'] for host in stats.values())
+        errors = sum(host['errors'] for host in stats.values())
+        print(f"HTTP ({label}): {total} requests to {len(stats)} hosts, {errors} errors")
+        for host, host_stats in sorted(stats.items(), key=lambda item: item[1]['requests'], reverse=True)[:5]:
+            print(f"  {host}: {host_stats['requests']} requests, mean {host_stats['latency_seconds']['mean']}s, "
+                  f"p95 {host_stats['latency_seconds']['p95']}s, waited {host_stats['wait_seconds']}s")
+        if path:
+            exported = {}
+            if os.path.exists(path):
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        exported = json.load(f)
+                except (OSError, ValueError):
+                    exported = {}
+            exported[label] = stats
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(exported, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, path)
+        self.reset_stats()
+
+# 本进程内唯一的网络出口
+client = HttpClient()
+
+def is_transient_status(status_code):
+    # 429 与 5xx 下次可能成功，其余 4xx（如 404）视为永久错误
+    return status_code == 429 or status_code >= 500
+
+def is_transient_error(error):
+    # 网络错误、超时以及 429/5xx 响应引发的 HTTPError
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return is_transient_status(error.response.status_code)
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+def get(url, **kwargs):
+    return client.get(url, **kwargs)
+
+def head(url, **kwargs):
+    return client.head(url, **kwargs)
+
+def post(url, **kwargs):
+    return client.post(url, **kwargs)
+
+def stream(url, **kwargs):
+    return client.stream(url, **kwargs)
+
+def report(label):
+    client.report(label)
@@ -0,0 +1,92 @@
+import io
+import os
+import json
+import hashlib
+import threading
+from PIL import Image, ImageOps
+
+FORMAT_EXTENSIONS = {'JPEG': 'jpg', 'WEBP': 'webp'}
+
+def process_image(data, max_width, image_format='JPEG', quality=82):
+    # Decode, downscale to max_width and re-encode as progressive JPEG or WebP; returns None for non-images.
+    # Pillow decodes lazily, so truncated files and unsupported modes can fail in any step up to save()
+    try:
+        image = Image.open(io.BytesIO(data))
+        # Let the JPEG decoder skip detail we are about to throw away
+        image.draft('RGB', (max_width, max_width * 4))
+        image = ImageOps.exif_transpose(image)
+
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGBA')
+            if image_format == 'JPEG':
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+        if image.width > max_width:
+            image = image.resize((max_width, round(image.height * max_width / image.width)), Image.LANCZOS)
+
+        output = io.BytesIO()
+        if image_format == 'WEBP':
+            image.save(output, 'WEBP', quality=quality, method=4)
+        else:
+            image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+        return output.getvalue()
+    except Exception:
+        return None
+
+class ThumbnailCache:
+    # Persistent cache of processed thumbnails, indexed by source URL and keyed on disk by content hash
+    def __init__(self, cache_dir, max_width, image_format='JPEG', quality=82):
+        self.cache_dir = cache_dir
+        self.max_width = max_width
+        self.image_format = image_format.upper()
+        self.quality = quality
+        self.extension = FORMAT_EXTENSIONS.get(self.image_format, 'jpg')
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _variant(self):
+        # Processed files depend on the output settings as well as the source bytes
+        return f"{self.max_width}_{self.quality}.{self.extension}"
+
+    def lookup(self, url):
+        with self.lock:
+            entry = self.index.get(url)
+        if entry:
+            path = os.path.join(self.cache_dir, f"{entry}_{self._variant()}")
+            if os.path.exists(path):
+                return path
+        return None
+
+    def store(self, url, data):
+        content_hash = hashlib.sha256(data).hexdigest()[:32]
+        path = os.path.join(self.cache_dir, f"{content_hash}_{self._variant()}")
+        if not os.path.exists(path):
+            processed = process_image(data, self.max_width, self.image_format, self.quality)
+            if processed is None:
+                return None
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(processed)
+            os.replace(tmp_path, path)
+        with self.lock:
+            self.index[url] = content_hash
+        return path
+
+    def save(self):
+        with self.lock:
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f, indent=4)
+            os.replace(tmp_path, self.index_path)
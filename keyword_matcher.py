@@ -0,0 +1,50 @@
+import re
+
+class KeywordMatcher:
+    # 将所有关键字变体编译为一个忽略大小写的正则表达式，一次扫描即可判断是否命中
+    def __init__(self, keywords):
+        variants = {keyword.lower() for keyword in keywords}
+        # 与原先的子串判断保持一致：空关键字匹配任何内容
+        self.match_all = '' in variants
+        variants.discard('')
+        self.max_length = max(map(len, variants), default=0)
+        # 长的变体放在前面，避免被其前缀抢先匹配
+        pattern = '|'.join(re.escape(variant) for variant in sorted(variants, key=len, reverse=True))
+        self.pattern = re.compile(pattern, re.IGNORECASE) if variants else None
+
+    def search(self, text):
+        if self.match_all:
+            return True
+        if self.pattern is None:
+            return False
+        return self.pattern.search(text) is not None
+
+    def scan(self):
+        return KeywordScan(self)
+
+    def search_stream(self, chunks):
+        # 逐块扫描文本，命中后立即停止
+        scan = self.scan()
+        for chunk in chunks:
+            if scan.feed(chunk):
+                return True
+        return scan.matched
+
+class KeywordScan:
+    # search_stream 的增量形式，供边下载边解析的调用方逐块送入文本；命中后不再扫描后续内容。
+    # 保留上一块的末尾，避免漏掉跨块的关键字
+    def __init__(self, matcher):
+        self.matcher = matcher
+        self.matched = matcher.match_all
+        self.tail = ''
+
+    def feed(self, chunk):
+        if self.matched or self.matcher.pattern is None:
+            return self.matched
+        window = self.tail + chunk
+        if self.matcher.pattern.search(window):
+            self.matched = True
+        else:
+            overlap = self.matcher.max_length - 1
+            self.tail = window[-overlap:] if overlap else ''
+        return self.matched
@@ -0,0 +1,69 @@
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+def cache_key(payload):
+    # 以模型、系统提示词、用户内容（以及其余请求参数）的哈希作为键
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+class LLMCache:
+    # 持久化的 API 响应缓存：按内容寻址，带 TTL 和按总大小的 LRU 淘汰
+    def __init__(self, path, ttl_seconds, max_bytes):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT,
+                size INTEGER,
+                created_at REAL,
+                last_access REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_last_access ON responses (last_access);
+        """)
+        self.conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - ttl_seconds,))
+        self.conn.commit()
+
+    def get(self, payload):
+        key = cache_key(payload)
+        with self.lock:
+            row = self.conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or row[1] < time.time() - self.ttl_seconds:
+                self.misses += 1
+                return None
+            self.conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self.hits += 1
+            return json.loads(row[0])
+
+    def put(self, payload, response):
+        key = cache_key(payload)
+        data = json.dumps(response, ensure_ascii=False)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, data, len(data.encode('utf-8')), now, now)
+            )
+            self.evict()
+            self.conn.commit()
+
+    def evict(self):
+        # 总大小超出上限时，按最近访问时间从旧到新删除
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self.conn.execute("SELECT key, size FROM responses ORDER BY last_access").fetchall():
+            self.conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def report(self):
+        print(f"LLM cache: {self.hits} hits, {self.misses} misses")
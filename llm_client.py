@@ -0,0 +1,169 @@
+import os
+import re
+import time
+import random
+import threading
+from collections import deque
+import requests
+import http_client
+import metrics
+from dotenv import load_dotenv
+from llm_cache import LLMCache
+from token_budget import count_tokens
+
+# 加载环境变量
+load_dotenv()
+
+# 设置自定义API端点和密钥
+CUSTOM_API_URL = os.getenv("CUSTOM_API_URL")
+API_KEY = os.getenv("API_KEY")
+LLM_TIMEOUT = int(os.getenv("LLM_TIMEOUT", 120))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 5))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 0))  # 0 表示不限制
+LLM_CACHE_FILE = os.getenv("LLM_CACHE_FILE", "llm_cache.db")  # 留空则不缓存
+LLM_CACHE_TTL_DAYS = float(os.getenv("LLM_CACHE_TTL_DAYS", 30))
+LLM_CACHE_MAX_MB = float(os.getenv("LLM_CACHE_MAX_MB", 100))
+
+def parse_duration(value):
+    # 解析 x-ratelimit-reset-* 的时长格式，例如 "1s"、"6m0s"、"20ms"、"0.5"
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    total = 0.0
+    for amount, unit in re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value):
+        total += float(amount) * {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}[unit]
+    return total or None
+
+def estimate_tokens(payload):
+    return sum(count_tokens(message['content'], payload.get('model', 'gpt-3.5-turbo')) for message in payload['messages'])
+
+class RateLimiter:
+    # 所有工作线程共享：服务端要求暂停时全体等待，并可按每分钟 token 预算限流
+    def __init__(self, tokens_per_minute=0):
+        self.tokens_per_minute = tokens_per_minute
+        self.lock = threading.Lock()
+        self.pause_until = 0.0
+        self.window = deque()  # (发送时间, token 数)
+
+    def acquire(self, tokens):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                delay = self.pause_until - now
+                if self.tokens_per_minute:
+                    while self.window and self.window[0][0] <= now - 60:
+                        self.window.popleft()
+                    used = sum(count for _, count in self.window)
+                    if self.window and used + tokens > self.tokens_per_minute:
+                        delay = max(delay, self.window[0][0] + 60 - now)
+                if delay <= 0:
+                    if self.tokens_per_minute:
+                        self.window.append((now, tokens))
+                    return
+            time.sleep(delay)
+
+    def pause(self, seconds):
+        with self.lock:
+            self.pause_until = max(self.pause_until, time.monotonic() + seconds)
+
+    def update_from_headers(self, headers):
+        # 请求或 token 配额用尽时，暂停到配额重置为止
+        for kind in ('requests', 'tokens'):
+            remaining = headers.get(f'x-ratelimit-remaining-{kind}')
+            if remaining is not None and remaining.strip() == '0':
+                reset = parse_duration(headers.get(f'x-ratelimit-reset-{kind}'))
+                if reset:
+                    self.pause(reset)
+
+rate_limiter = RateLimiter(LLM_TOKENS_PER_MINUTE)
+
+# 本进程内的 API 用量统计
+usage_lock = threading.Lock()
+usage_stats = {'requests': 0, 'cache_hits': 0, 'prompt_tokens': 0, 'completion_tokens': 0}
+
+def record_usage(key, amount=1):
+    with usage_lock:
+        usage_stats[key] += amount
+    metrics.count(f"llm_{key}", amount)
+
+def get_usage():
+    with usage_lock:
+        return dict(usage_stats)
+
+# 评分与摘要共用的响应缓存，内容、提示词和模型完全相同时不再调用 API
+llm_cache = LLMCache(LLM_CACHE_FILE, LLM_CACHE_TTL_DAYS * 86400, int(LLM_CACHE_MAX_MB * 1024 * 1024)) if LLM_CACHE_FILE else None
+
+def backoff_delay(attempt):
+    # 指数退避加抖动
+    delay = min(60, 2 ** attempt)
+    return delay / 2 + random.uniform(0, delay / 2)
+
+def is_usable(result, validate=None):
+    # 有回复内容，且调用方能解析（validate 接收回复文本）的响应才写入缓存
+    try:
+        text = result['choices'][0]['message']['content']
+    except (KeyError, IndexError, TypeError):
+        return False
+    if not text or not text.strip():
+        return False
+    return validate is None or bool(validate(text))
+
+def chat_completion(payload, validate=None):
+    # 调用 OpenAI 兼容的接口并返回解析后的 JSON；遇到 429/5xx/网络错误时自动重试
+    if llm_cache:
+        cached = llm_cache.get(payload)
+        if cached is not None and is_usable(cached, validate):
+            record_usage('cache_hits')
+            return cached
+        metrics.count('llm_cache_misses')
+
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {API_KEY}"
+    }
+    tokens = estimate_tokens(payload)
+
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        last_attempt = attempt == LLM_MAX_RETRIES
+        rate_limiter.acquire(tokens)
+        record_usage('requests')
+        try:
+            # 重试与限流由本模块处理，共享客户端只提供连接复用和延迟统计
+            with metrics.timer('llm_call'):
+                response = http_client.post(CUSTOM_API_URL, headers=headers, json=payload, timeout=LLM_TIMEOUT, retries=0, polite=False)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            metrics.count('llm_errors')
+            if last_attempt:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Request failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        rate_limiter.update_from_headers(response.headers)
+        if response.status_code == 429 or response.status_code >= 500:
+            metrics.count('llm_errors')
+            if last_attempt:
+                response.raise_for_status()
+            delay = parse_duration(response.headers.get('Retry-After')) or backoff_delay(attempt)
+            if response.status_code == 429:
+                rate_limiter.pause(delay)
+            print(f"API returned {response.status_code}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+            continue
+
+        response.raise_for_status()
+        result = response.json()
+        usage = result.get('usage') or {}
+        record_usage('prompt_tokens', usage.get('prompt_tokens', 0))
+        record_usage('completion_tokens', usage.get('completion_tokens', 0))
+        if llm_cache and is_usable(result, validate):
+            llm_cache.put(payload, result)
+        return result
+
+def report_cache():
+    if llm_cache:
+        llm_cache.report()
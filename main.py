@@ -1,12 +1,17 @@
 import subprocess
+import argparse
 import time
 import os
+import metrics
+from pipeline import STAGES, STAGE_NAMES, run_pipeline
 
-def run_script(script_name):
+def run_script(script_name, profile_name=None):
     start_time = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime())
     print(f"Starting {script_name} at {start_time}")
     
-    process = subprocess.Popen(['python', script_name], stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
+    # A profiled stage runs under cProfile in its own process and writes profile_<stage>.prof/.txt
+    command = ['python', 'metrics.py', 'profile', script_name, profile_name] if profile_name else ['python', script_name]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, encoding='utf-8', errors='replace')
     
     while True:
         output = process.stdout.readline()
@@ -22,20 +27,47 @@ def run_script(script_name):
         print(f"{script_name} executed successfully.")
     else:
         print(f"Error executing {script_name}:\n{stderr}")
+    return returncode
+
+def run_subprocess_pipeline(profile=None):
+    # Each script files its own stage metrics into the run report; the wall times are added here
+    metrics.start_run()
+    stages = []
+    for i, stage in enumerate(STAGES, start=1):
+        script = stage['script']
+        print(f"Running script {i}/{len(STAGES)}: {script}")
+        profiled = profile is not None and (not profile or stage['name'] in profile)
+        start_time = time.perf_counter()
+        returncode = run_script(script, stage['name'] if profiled else None)
+        stages.append({'stage': stage['name'], 'seconds': round(time.perf_counter() - start_time, 3), 'returncode': returncode})
+    metrics.report_pipeline(stages)
 
 def main():
-    scripts = [
-        'rss_digest.py',
-        'rating-openai.py',
-        'summerize-high-rated.py',
-        'make_newsletter.py',
-        'renderpng.py',
-        'cleanup.py'
-    ]
+    parser = argparse.ArgumentParser(description="Run the newsletter pipeline")
+    parser.add_argument('--in-process', action='store_true',
+                        help="run all stages in this interpreter and hand data over in memory (reports per-stage time and peak memory)")
+    parser.add_argument('--no-checkpoints', action='store_true',
+                        help="with --in-process, skip the intermediate files (articles_text/, article_ratings.json, article_summaries.json, ...)")
+    parser.add_argument('--no-tracemalloc', action='store_true',
+                        help="with --in-process, only report process peak RSS (tracemalloc slows allocation-heavy stages)")
+    parser.add_argument('--from-stage', choices=STAGE_NAMES,
+                        help="run this stage and the ones after it, reading earlier results from the checkpoint files (implies --in-process)")
+    parser.add_argument('--only-stage', choices=STAGE_NAMES,
+                        help="run only this stage from the checkpoint files (implies --in-process)")
+    parser.add_argument('--profile', nargs='*', choices=STAGE_NAMES, metavar='STAGE',
+                        help="run the given stages (all stages when none are given) under cProfile and write profile_<stage>.prof/.txt")
+    parser.add_argument('--daemon', action='store_true',
+                        help="keep running: poll each feed on its own adaptive schedule and publish on NEWSLETTER_SCHEDULE")
+    args = parser.parse_args()
 
-    for i, script in enumerate(scripts, start=1):
-        print(f"Running script {i}/{len(scripts)}: {script}")
-        run_script(script)
+    if args.daemon:
+        from daemon import run_daemon
+        run_daemon()
+    elif args.in_process or args.from_stage or args.only_stage:
+        run_pipeline(checkpoint=not args.no_checkpoints, trace_memory=not args.no_tracemalloc,
+                     from_stage=args.from_stage, only_stage=args.only_stage, profile=args.profile)
+    else:
+        run_subprocess_pipeline(args.profile)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,15 +1,35 @@
 import json
 import os
 import requests
+import http_client
+import metrics
 import re
+import shutil
+from concurrent.futures import ThreadPoolExecutor
 from jinja2 import Environment, FileSystemLoader
-from urllib.parse import urlparse, parse_qs
-from bs4 import BeautifulSoup
+from urllib.parse import urlparse, parse_qs, urljoin
 from dotenv import load_dotenv
+from html_extract import extract_page_stream
+from image_pipeline import ThumbnailCache
+from page_store import open_page_store
+from stage_types import NewsletterResult
 
 # Load environment variables
 load_dotenv()
 
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", 8))  # Number of articles whose thumbnails are resolved at once
+WIDTH = int(os.getenv('WIDTH', 800))
+DEVICE_PIXEL_RATIO = int(os.getenv('DEVICE_PIXEL_RATIO', 2))
+THUMBNAIL_FORMAT = os.getenv('THUMBNAIL_FORMAT', 'jpeg')  # jpeg or webp
+THUMBNAIL_QUALITY = int(os.getenv('THUMBNAIL_QUALITY', 82))
+THUMBNAIL_CACHE_DIR = os.getenv('THUMBNAIL_CACHE_DIR', 'thumbnail_cache')
+
+# Thumbnails are never shown wider than the rendered page
+thumbnail_cache = ThumbnailCache(THUMBNAIL_CACHE_DIR, WIDTH * DEVICE_PIXEL_RATIO, THUMBNAIL_FORMAT, THUMBNAIL_QUALITY)
+
+# Image candidates recorded by rss_digest while it extracted the article, so pages are not downloaded again
+page_store = open_page_store()
+
 def get_youtube_thumbnail(url):
     parsed_url = urlparse(url)
     if parsed_url.netloc in ['www.youtube.com', 'youtu.be']:
@@ -21,48 +41,35 @@ def get_youtube_thumbnail(url):
             return f"https://img.youtube.com/vi/{video_id}/0.jpg"
     return None
 
-def get_og_image(url):
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        og_image = soup.find('meta', property='og:image')
-        if og_image:
-            return og_image['content']
-    except requests.RequestException:
-        pass
-    return None
-
-def get_first_image(url):
-    try:
-        response = requests.get(url, timeout=10)
+def fetch_page_images(url):
+    # Fetch the article page once and collect every image candidate from a single incremental parse
+    with http_client.stream(url) as response:
         response.raise_for_status()
-        soup = BeautifulSoup(response.content, 'html.parser')
-        images = soup.find_all('img')
-        for img in images:
-            if 'src' in img.attrs:
-                src = img['src']
-                # Filter out common ad-related keywords
-                if not any(keyword in src.lower() for keyword in ['ad', 'banner', 'sponsor']):
-                    return src
-    except requests.RequestException:
-        pass
-    return None
-
-def get_thumbnail(url):
-    thumbnail_url = get_youtube_thumbnail(url)
-    if thumbnail_url and is_url_reachable(thumbnail_url):
-        return thumbnail_url
-
-    thumbnail_url = get_og_image(url)
-    if thumbnail_url and is_url_reachable(thumbnail_url):
-        return thumbnail_url
+        if response.encoding is None:
+            response.encoding = 'utf-8'
+        return extract_page_stream(response.iter_content(chunk_size=16384, decode_unicode=True), stop_on='images')
+
+def resolve_thumbnail(url, thumbnail_filename):
+    # Candidates are tried in order; a successful download doubles as the reachability check
+    youtube_thumbnail = get_youtube_thumbnail(url)
+    if youtube_thumbnail and download_thumbnail(youtube_thumbnail, thumbnail_filename):
+        return True
 
-    thumbnail_url = get_first_image(url)
-    if thumbnail_url and is_url_reachable(thumbnail_url):
-        return thumbnail_url
-
-    return None
+    images = page_store.images(url) if page_store else None
+    metrics.count('page_store_misses' if images is None else 'page_store_hits')
+    if images is None:
+        # Only pages missing from the store (evicted, or fetched before it existed) are downloaded
+        try:
+            images = fetch_page_images(url)
+        except requests.RequestException:
+            return False
+        if page_store:
+            page_store.put(url, None, images)
+
+    for candidate in (images['og_image'], images['first_image']):
+        if candidate and download_thumbnail(urljoin(url, candidate), thumbnail_filename):
+            return True
+    return False
 
 def sanitize_filename(filename):
     # Remove or replace special characters
@@ -72,53 +79,66 @@ def sanitize_filename(filename):
     return filename[:255]  # Truncate to max filename length
 
 def download_thumbnail(url, filename):
-    try:
-        response = requests.get(url, timeout=10)
-        response.raise_for_status()
-        with open(filename, 'wb') as f:
-            f.write(response.content)
-        return True
-    except requests.RequestException:
-        return False
-
-def is_url_reachable(url):
-    try:
-        response = requests.head(url, timeout=5)
-        return response.status_code == 200
-    except requests.RequestException:
-        return False
+    # Repeated sources are served from the thumbnail cache without downloading or processing again
+    cached_path = thumbnail_cache.lookup(url)
+    metrics.count('thumbnail_cache_hits' if cached_path else 'thumbnail_cache_misses')
+    if not cached_path:
+        try:
+            response = http_client.get(url)
+            response.raise_for_status()
+            if response.status_code != 200:
+                return False
+        except requests.RequestException:
+            metrics.count('thumbnail_errors')
+            return False
+        metrics.count('thumbnail_bytes', len(response.content))
+        # Resize and re-encode; responses that are not decodable images are rejected
+        cached_path = thumbnail_cache.store(url, response.content)
+        if not cached_path:
+            metrics.count('thumbnail_errors')
+            return False
+    shutil.copyfile(cached_path, filename)
+    return True
+
+def process_thumbnail(thumbnails_dir, filename, data):
+    url = data['url']
+    safe_filename = sanitize_filename(filename)
+    thumbnail_filename = os.path.join(thumbnails_dir, f"{safe_filename.replace('.txt', '.' + thumbnail_cache.extension)}")
+    with metrics.timer('thumbnail'):
+        found = resolve_thumbnail(url, thumbnail_filename)
+    if found:
+        data['thumbnail'] = os.path.relpath(thumbnail_filename)
+    else:
+        data['thumbnail'] = None
+
+    # Add source to data
+    data['source'] = urlparse(url).netloc
 
 def write_titles_and_links(summaries, output_file):
     with open(output_file, 'w', encoding='utf-8') as f:
         for data in summaries.values():
             f.write(f"{data['chinese_title']}\n{data['url']}\n\n")
 
-def main():
-    # Load article summaries
-    with open('article_summaries.json', 'r', encoding='utf-8') as f:
-        summaries = json.load(f)
+def run(summaries=None, output_file='newsletter.html'):
+    # In-process entry point: summaries come from the summary stage, or from article_summaries.json when None
+    if summaries is None:
+        # Load article summaries
+        with open('article_summaries.json', 'r', encoding='utf-8') as f:
+            summaries = json.load(f)
 
     # Create thumbnails directory
     thumbnails_dir = 'thumbnails'
     os.makedirs(thumbnails_dir, exist_ok=True)
 
-    # Process each article
-    for filename, data in summaries.items():
-        url = data['url']
-        thumbnail_url = get_thumbnail(url)
-        
-        if thumbnail_url:
-            safe_filename = sanitize_filename(filename)
-            thumbnail_filename = os.path.join(thumbnails_dir, f"{safe_filename.replace('.txt', '.jpg')}")
-            if download_thumbnail(thumbnail_url, thumbnail_filename):
-                data['thumbnail'] = os.path.relpath(thumbnail_filename)
-            else:
-                data['thumbnail'] = None
-        else:
-            data['thumbnail'] = None
-
-        # Add source to data
-        data['source'] = urlparse(url).netloc
+    # Resolve thumbnails for all articles concurrently over the shared pooled client,
+    # so the stage takes about as long as the slowest article
+    with ThreadPoolExecutor(max_workers=THUMBNAIL_WORKERS) as executor:
+        list(executor.map(lambda item: process_thumbnail(thumbnails_dir, *item), summaries.items()))
+    thumbnail_cache.save()
+    if page_store:
+        page_store.report()
+    http_client.report('newsletter')
+    metrics.report('newsletter')
 
     # Get title and font from environment variables
     title = os.getenv('NEWSLETTER_TITLE', '文章摘要通讯')
@@ -130,15 +150,19 @@ def main():
 
     newsletter_html = template.render(articles=summaries.values(), title=title, font=font)
 
-    # Save the newsletter
-    with open('newsletter.html', 'w', encoding='utf-8') as f:
+    # Save the newsletter (the render stage loads it from disk)
+    with open(output_file, 'w', encoding='utf-8') as f:
         f.write(newsletter_html)
 
     # Write titles and links to a text file
     write_titles_and_links(summaries, 'titles_and_links.txt')
 
-    print("Newsletter created: newsletter.html")
+    print(f"Newsletter created: {output_file}")
     print("Titles and links saved: titles_and_links.txt")
+    return NewsletterResult(output_file, summaries)
+
+def main():
+    run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
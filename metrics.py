@@ -0,0 +1,262 @@
+import os
+import sys
+import json
+import time
+import runpy
+import pstats
+import cProfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+METRICS_REPORT_FILE = os.getenv('METRICS_REPORT_FILE', 'run_report.json')  # JSON run report, empty disables
+METRICS_PROMETHEUS_FILE = os.getenv('METRICS_PROMETHEUS_FILE', '')  # Prometheus textfile-collector output, empty disables
+PROFILE_TOP_FUNCTIONS = 40
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'count': len(samples),
+        'total_seconds': round(sum(samples), 3),
+        'mean': round(sum(samples) / len(samples), 4),
+        'p50': round(samples[len(samples) // 2], 4),
+        'p95': round(samples[int(len(samples) * 0.95)], 4),
+        'max': round(samples[-1], 4)
+    }
+
+class Metrics:
+    # Process-wide timings and counters: stages time each unit of work (feed fetch, HTML fetch, extraction, LLM call, ...)
+    # and count bytes, tokens, cache hits/misses and errors; report() files them under the stage's name and starts over
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.timings = {}
+        self.counters = {}
+
+    def observe(self, name, seconds):
+        with self.lock:
+            self.timings.setdefault(name, []).append(seconds)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, name):
+        # Works across awaits too, so it measures wall time including time spent waiting
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self):
+        with self.lock:
+            timings = {name: summarize(samples) for name, samples in self.timings.items()}
+            counters = dict(self.counters)
+        # Every <name>_hits counter with a matching <name>_misses yields a hit rate
+        hit_rates = {}
+        for name, hits in counters.items():
+            if name.endswith('_hits'):
+                cache = name[:-len('_hits')]
+                total = hits + counters.get(f"{cache}_misses", 0)
+                if total:
+                    hit_rates[cache] = round(hits / total, 3)
+        return {'timings': timings, 'counters': counters, 'cache_hit_rates': hit_rates}
+
+    def reset(self):
+        with self.lock:
+            self.timings = {}
+            self.counters = {}
+
+    def report(self, label, path=METRICS_REPORT_FILE):
+        # Print the slowest operations and merge this stage's numbers into the run report
+        snapshot = self.snapshot()
+        self.reset()
+        if not snapshot['timings'] and not snapshot['counters']:
+            return
+        slowest = sorted(snapshot['timings'].items(), key=lambda item: item[1]['total_seconds'], reverse=True)[:5]
+        print(f"Metrics ({label}): " + ', '.join(f"{name} {timing['count']}x {timing['total_seconds']}s (p95 {timing['p95']}s)"
+                                                  for name, timing in slowest))
+        if snapshot['cache_hit_rates']:
+            print("  cache hit rates: " + ', '.join(f"{cache} {rate:.0%}" for cache, rate in snapshot['cache_hit_rates'].items()))
+
+        def add_stage(run_report):
+            run_report.setdefault('stages', {})[label] = dict(snapshot, finished_at=datetime.now().isoformat(timespec='seconds'))
+        update_report(add_stage, path)
+
+# One registry per process, like the shared HTTP client
+metrics = Metrics()
+
+def timer(name):
+    return metrics.timer(name)
+
+def observe(name, seconds):
+    metrics.observe(name, seconds)
+
+def count(name, amount=1):
+    metrics.count(name, amount)
+
+def report(label):
+    metrics.report(label)
+
+def load_report(path=METRICS_REPORT_FILE):
+    if path and os.path.exists(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            pass
+    return {}
+
+def update_report(update, path=METRICS_REPORT_FILE):
+    # Stages run one after another (or in separate processes), so read-modify-replace is enough
+    if not path:
+        return
+    run_report = load_report(path)
+    update(run_report)
+    run_report['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(run_report, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_path, path)
+    if METRICS_PROMETHEUS_FILE:
+        write_prometheus(run_report, METRICS_PROMETHEUS_FILE)
+
+def clear_report(path=METRICS_REPORT_FILE):
+    def clear(run_report):
+        run_report.clear()
+        run_report.update({'run_started_at': datetime.now().isoformat(timespec='seconds'), 'stages': {}})
+    update_report(clear, path)
+
+def start_run(path=METRICS_REPORT_FILE):
+    # A new run starts with an empty report; resumed runs keep adding to the existing one
+    metrics.reset()
+    clear_report(path)
+
+def report_pipeline(stages, path=METRICS_REPORT_FILE):
+    # stages: per-stage wall time (and peak memory in-process) recorded by whoever ran them
+    def add_pipeline(run_report):
+        run_report['pipeline'] = {'stages': stages, 'total_seconds': round(sum(stage['seconds'] for stage in stages), 3)}
+    update_report(add_pipeline, path)
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_labels(**labels):
+    return '{' + ','.join(f'{key}="{escape_label(value)}"' for key, value in labels.items()) + '}'
+
+def write_prometheus(run_report, path):
+    # Text exposition format for node_exporter's textfile collector; every value describes the latest run
+    lines = []
+
+    def family(name, kind, help_text):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    pipeline = run_report.get('pipeline', {}).get('stages', [])
+    family('newsletter_stage_duration_seconds', 'gauge', 'Wall time of each pipeline stage in the latest run')
+    for stage in pipeline:
+        lines.append(f"newsletter_stage_duration_seconds{prometheus_labels(stage=stage['stage'])} {stage['seconds']}")
+    family('newsletter_stage_peak_rss_bytes', 'gauge', 'Process peak RSS after each in-process stage')
+    for stage in pipeline:
+        if stage.get('rss_peak_bytes') is not None:
+            lines.append(f"newsletter_stage_peak_rss_bytes{prometheus_labels(stage=stage['stage'])} {stage['rss_peak_bytes']}")
+
+    stages = run_report.get('stages', {})
+    family('newsletter_operation_duration_seconds', 'summary', 'Duration of individual operations within a stage')
+    for stage, data in stages.items():
+        for operation, timing in data.get('timings', {}).items():
+            for quantile in ('p50', 'p95'):
+                labels = prometheus_labels(stage=stage, operation=operation, quantile=f"0.{quantile[1:]}")
+                lines.append(f"newsletter_operation_duration_seconds{labels} {timing[quantile]}")
+            labels = prometheus_labels(stage=stage, operation=operation)
+            lines.append(f"newsletter_operation_duration_seconds_sum{labels} {timing['total_seconds']}")
+            lines.append(f"newsletter_operation_duration_seconds_count{labels} {timing['count']}")
+    family('newsletter_events', 'gauge', 'Counters (bytes, tokens, cache hits/misses, errors) of the latest run')
+    for stage, data in stages.items():
+        for name, value in data.get('counters', {}).items():
+            lines.append(f"newsletter_events{prometheus_labels(stage=stage, name=name)} {value}")
+    family('newsletter_cache_hit_ratio', 'gauge', 'Cache hit ratio per stage and cache')
+    for stage, data in stages.items():
+        for cache, rate in data.get('cache_hit_rates', {}).items():
+            lines.append(f"newsletter_cache_hit_ratio{prometheus_labels(stage=stage, cache=cache)} {rate}")
+    family('newsletter_report_updated_timestamp_seconds', 'gauge', 'When the run report was last updated')
+    lines.append(f"newsletter_report_updated_timestamp_seconds {time.time():.0f}")
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(tmp_path, path)
+
+def report_dir():
+    return os.path.dirname(METRICS_REPORT_FILE) or '.'
+
+class StageProfiler:
+    # cProfile before Python 3.12 only sees the thread that enabled it, and the stages do most of their work in
+    # thread pools, so every thread started while profiling gets its own profile and they are merged at the end
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = [cProfile.Profile()]
+        self.per_thread = sys.version_info < (3, 12)
+
+    def start_thread_profile(self, *args):
+        # Installed with threading.setprofile, so it runs once as the first profiling event of each new thread
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def __enter__(self):
+        if self.per_thread:
+            threading.setprofile(self.start_thread_profile)
+        self.profiles[0].enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiles[0].disable()
+        if self.per_thread:
+            threading.setprofile(None)
+
+    def dump(self, name, directory=None):
+        # Writes profile_<name>.prof (for snakeviz / pstats) and the top functions by cumulative time as text
+        directory = directory or report_dir()
+        os.makedirs(directory, exist_ok=True)
+        stats = pstats.Stats(self.profiles[0])
+        for profile in self.profiles[1:]:
+            try:
+                stats.add(profile)
+            except TypeError:
+                pass  # A thread that never ran any Python code
+        prof_path = os.path.join(directory, f"profile_{name}.prof")
+        text_path = os.path.join(directory, f"profile_{name}.txt")
+        stats.dump_stats(prof_path)
+        with open(text_path, 'w', encoding='utf-8') as f:
+            stats.stream = f
+            stats.sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        print(f"Profile of {name} written to {prof_path} ({text_path})")
+
+def profile_call(name, func, *args, **kwargs):
+    profiler = StageProfiler()
+    try:
+        with profiler:
+            return func(*args, **kwargs)
+    finally:
+        profiler.dump(name)
+
+def profile_script(script_path, name=None):
+    # Used by main.py to profile a stage that runs in its own process
+    name = name or os.path.splitext(os.path.basename(script_path))[0]
+    sys.argv = [script_path]
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script_path)))
+    profile_call(name, runpy.run_path, script_path, run_name='__main__')
+
+if __name__ == "__main__":
+    # python metrics.py profile <script> [name]
+    if len(sys.argv) < 3 or sys.argv[1] != 'profile':
+        sys.exit("usage: python metrics.py profile <script> [name]")
+    profile_script(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None)
@@ -0,0 +1,150 @@
+import os
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+
+# zstandard 为可选依赖，未安装时用 zlib 压缩
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+class PageStore:
+    # 文章页面的共享存储：HTML 按内容哈希压缩保存为独立文件，SQLite 索引记录 URL、抓取时间以及
+    # 提取正文时顺带找到的 og:image 和第一张图片；按保存时间和总大小淘汰
+    def __init__(self, directory, max_age_seconds, max_bytes):
+        self.directory = directory
+        self.max_age_seconds = max_age_seconds
+        self.max_bytes = max_bytes
+        self.extension = 'zst' if zstandard else 'zz'
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(os.path.join(directory, 'blobs'), exist_ok=True)
+        self.conn = sqlite3.connect(os.path.join(directory, 'index.db'), check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                hash TEXT,
+                og_image TEXT,
+                first_image TEXT,
+                fetched_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS blobs (
+                hash TEXT PRIMARY KEY,
+                path TEXT,
+                size INTEGER,
+                created_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS idx_pages_fetched_at ON pages (fetched_at);
+        """)
+        with self.lock:
+            self.evict()
+            self.conn.commit()
+
+    def compress(self, data):
+        if zstandard:
+            return zstandard.ZstdCompressor(level=10).compress(data)
+        return zlib.compress(data, 6)
+
+    def decompress(self, path, data):
+        if path.endswith('.zst'):
+            if zstandard is None:
+                # 之前用 zstd 保存、现在未安装 zstandard：按未保存处理，重新下载页面
+                raise ValueError("zstandard is not installed")
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zlib.decompress(data)
+
+    def put(self, url, html, page):
+        # html 为空时（流式提取只读了页面开头）只记录图片候选
+        content_hash = None
+        now = time.time()
+        if html:
+            data = html.encode('utf-8')
+            content_hash = hashlib.sha256(data).hexdigest()
+            path = os.path.join(self.directory, 'blobs', content_hash[:2], f"{content_hash}.{self.extension}")
+            if not os.path.exists(path):
+                compressed = self.compress(data)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(compressed)
+                os.replace(tmp_path, path)
+            size = os.path.getsize(path)
+        with self.lock:
+            # 文件与索引在同一个事务中登记，淘汰时不会误删刚写入的文件
+            if content_hash:
+                self.conn.execute("INSERT OR IGNORE INTO blobs (hash, path, size, created_at) VALUES (?, ?, ?, ?)",
+                                  (content_hash, path, size, now))
+            self.conn.execute(
+                "INSERT OR REPLACE INTO pages (url, hash, og_image, first_image, fetched_at) VALUES (?, ?, ?, ?, ?)",
+                (url, content_hash, page.get('og_image'), page.get('first_image'), now)
+            )
+            self.evict()
+            self.conn.commit()
+
+    def images(self, url):
+        # 返回 {'og_image', 'first_image'}；页面从未记录过时返回 None
+        with self.lock:
+            row = self.conn.execute("SELECT og_image, first_image, fetched_at FROM pages WHERE url = ?", (url,)).fetchone()
+            if row is None or row[2] < time.time() - self.max_age_seconds:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return {'og_image': row[0], 'first_image': row[1]}
+
+    def get(self, url):
+        # 返回保存的 HTML；没有保存或文件已被淘汰时返回 None
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT blobs.path FROM pages JOIN blobs ON pages.hash = blobs.hash WHERE pages.url = ? AND pages.fetched_at >= ?",
+                (url, time.time() - self.max_age_seconds)
+            ).fetchone()
+        if row is None:
+            return None
+        try:
+            with open(row[0], 'rb') as f:
+                return self.decompress(row[0], f.read()).decode('utf-8')
+        except (OSError, zlib.error, ValueError):
+            return None
+
+    def evict(self):
+        # 先删除过期的页面，再按抓取时间从旧到新删除，直到压缩后的总大小不超过上限；最后清理不再被引用的文件
+        self.conn.execute("DELETE FROM pages WHERE fetched_at < ?", (time.time() - self.max_age_seconds,))
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM blobs WHERE hash IN (SELECT hash FROM pages)").fetchone()[0]
+        if total > self.max_bytes:
+            rows = self.conn.execute(
+                "SELECT pages.url, blobs.size FROM pages JOIN blobs ON pages.hash = blobs.hash ORDER BY pages.fetched_at"
+            ).fetchall()
+            for url, size in rows:
+                self.conn.execute("DELETE FROM pages WHERE url = ?", (url,))
+                total -= size
+                if total <= self.max_bytes:
+                    break
+        for content_hash, path in self.conn.execute(
+                "SELECT hash, path FROM blobs WHERE hash NOT IN (SELECT hash FROM pages WHERE hash IS NOT NULL)").fetchall():
+            self.conn.execute("DELETE FROM blobs WHERE hash = ?", (content_hash,))
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def report(self):
+        with self.lock:
+            pages, total = self.conn.execute(
+                "SELECT COUNT(*), (SELECT COALESCE(SUM(size), 0) FROM blobs) FROM pages").fetchone()
+        print(f"Page store: {pages} pages, {total / 1024 / 1024:.1f} MB compressed, {self.hits} image lookups served, {self.misses} misses")
+
+    def close(self):
+        self.conn.close()
+
+def open_page_store():
+    # rss_digest 与 make_newsletter 使用同一份配置；PAGE_STORE_DIR 留空则关闭
+    directory = os.getenv("PAGE_STORE_DIR", "page_store")
+    if not directory:
+        return None
+    max_age_days = float(os.getenv("PAGE_STORE_MAX_AGE_DAYS", 14))
+    max_mb = float(os.getenv("PAGE_STORE_MAX_MB", 200))
+    return PageStore(directory, max_age_days * 86400, int(max_mb * 1024 * 1024))
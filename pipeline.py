@@ -0,0 +1,195 @@
+import os
+import sys
+import time
+import resource
+import tracemalloc
+import metrics
+import importlib.util
+from dotenv import load_dotenv
+from stage_manifest import PipelineManifest, hash_inputs, hash_parts
+from article_store import open_article_store
+
+# Load environment variables (the stage settings are part of the input hashes)
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MANIFEST_FILE = os.getenv('PIPELINE_MANIFEST_FILE', 'pipeline_manifest.json')
+ARTICLE_STORE_FILE = os.getenv('ARTICLE_STORE_FILE', 'articles.db')
+RENDER_SEGMENT_MAX_HEIGHT = int(os.getenv('RENDER_SEGMENT_MAX_HEIGHT', 0))
+
+_modules = {}
+
+def load_stage(script_name):
+    # Import a stage script as a module once (the hyphenated names cannot be imported with a plain import)
+    if script_name not in _modules:
+        module_name = os.path.splitext(script_name)[0].replace('-', '_')
+        spec = importlib.util.spec_from_file_location(module_name, os.path.join(BASE_DIR, script_name))
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+        _modules[script_name] = module
+    return _modules[script_name]
+
+def peak_rss_bytes():
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def format_bytes(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size:.1f} {unit}"
+        size /= 1024
+
+class StageTimer:
+    # Records wall time, peak Python heap (tracemalloc) and process peak RSS for each stage
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stages = []
+
+    def run(self, name, func, *args, **kwargs):
+        print(f"Running stage: {name}")
+        if self.trace_memory:
+            if tracemalloc.is_tracing():
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.start()
+        start_time = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start_time
+            heap_peak = tracemalloc.get_traced_memory()[1] if self.trace_memory else None
+            self.stages.append({'stage': name, 'seconds': elapsed, 'heap_peak_bytes': heap_peak, 'rss_peak_bytes': peak_rss_bytes()})
+            print(f"Stage {name} finished in {elapsed:.2f}s")
+
+    def report(self):
+        print("Stage timings:")
+        for stage in self.stages:
+            heap = format_bytes(stage['heap_peak_bytes']) if stage['heap_peak_bytes'] is not None else 'n/a'
+            print(f"  {stage['stage']:<12} {stage['seconds']:>8.2f}s  heap peak {heap:>10}  process peak RSS {format_bytes(stage['rss_peak_bytes']):>10}")
+        print(f"  {'total':<12} {sum(stage['seconds'] for stage in self.stages):>8.2f}s")
+        if self.trace_memory:
+            tracemalloc.stop()
+
+# Stage graph: each stage reads the files its upstream stage writes, so a stage can be skipped or resumed
+# from the checkpoints alone. settings are the environment variables that change a stage's output.
+STAGES = [
+    {'name': 'fetch', 'script': 'rss_digest.py', 'inputs': ['feeds.opml'], 'outputs': ['articles_text'],
+     'settings': ['KEYWORDS', 'DATE_RANGE_DAYS', 'PREFILTER_MODE', 'EXTRACT_BACKEND']},
+    {'name': 'rate', 'script': 'rating-openai.py', 'inputs': ['articles_text'], 'outputs': ['high_rated_articles', 'article_ratings.json'],
+     'settings': ['RATING_CRITERIA', 'TOP_ARTICLES', 'RATING_MODE', 'RATING_INPUT_TOKENS', 'TRUNCATION_STRATEGY',
+                  'RATING_PRERANK', 'PRERANK_TOP_K', 'PRERANK_MIN_SIMILARITY']},
+    {'name': 'summarize', 'script': 'summerize-high-rated.py', 'inputs': ['high_rated_articles'], 'outputs': ['article_summaries.json'],
+     'settings': ['SUMMARY_MODE', 'SUMMARY_INPUT_TOKENS', 'SUMMARY_LONG_INPUT', 'TRUNCATION_STRATEGY']},
+    {'name': 'newsletter', 'script': 'make_newsletter.py', 'inputs': ['article_summaries.json', 'newsletter_template.html'],
+     'outputs': ['newsletter.html', 'titles_and_links.txt'],
+     'settings': ['NEWSLETTER_TITLE', 'NEWSLETTER_FONT', 'WIDTH', 'THUMBNAIL_FORMAT', 'THUMBNAIL_QUALITY']},
+    {'name': 'render', 'script': 'renderpng.py', 'inputs': ['newsletter.html', 'thumbnails'], 'outputs': ['newsletter.png'],
+     'settings': ['WIDTH', 'DEVICE_PIXEL_RATIO', 'RENDER_SEGMENT_MAX_HEIGHT']},
+    {'name': 'cleanup', 'script': 'cleanup.py', 'inputs': [], 'outputs': [], 'settings': []},
+]
+STAGE_NAMES = [stage['name'] for stage in STAGES]
+
+# With the article store, these directories are only an optional text export: the stages read and write
+# the store instead, so its current-edition fingerprint replaces them in the input hashes
+TEXT_EXPORTS = {'articles_text', 'high_rated_articles'}
+
+article_store = open_article_store()
+
+def stage_inputs(stage):
+    if not article_store:
+        return stage['inputs']
+    return [path for path in stage['inputs'] if path not in TEXT_EXPORTS]
+
+def stage_outputs(stage):
+    if stage['name'] == 'render' and RENDER_SEGMENT_MAX_HEIGHT:
+        # Segmented rendering writes newsletter_segments/ instead of newsletter.png; the manifest is written last
+        return [os.path.join('newsletter_segments', 'manifest.json')]
+    if not article_store:
+        return stage['outputs']
+    outputs = [path for path in stage['outputs'] if path not in TEXT_EXPORTS]
+    if len(outputs) < len(stage['outputs']):
+        outputs.append(ARTICLE_STORE_FILE)
+    return outputs
+
+def stage_input_hash(stage, manifest):
+    # fetch reads the network, so within one run it counts as unchanged and a new run always fetches again
+    extra = [manifest.run_id] if stage['name'] == 'fetch' else []
+    if article_store and len(stage_inputs(stage)) < len(stage['inputs']):
+        extra.append(article_store.fingerprint())
+    return hash_parts(hash_inputs(stage_inputs(stage), stage['settings']), *extra)
+
+def call_stage(module, name, upstream, checkpoint, progress):
+    # upstream is the in-memory output of the previous stage, or None to read its checkpoint files
+    if name == 'fetch':
+        return module.run(checkpoint=checkpoint)
+    if name == 'rate':
+        return module.run(upstream, checkpoint=checkpoint, progress=progress)
+    if name == 'summarize':
+        return module.run(upstream.top_articles if upstream else None, checkpoint=checkpoint, progress=progress)
+    if name == 'newsletter':
+        return module.run(upstream)
+    if name == 'render':
+        return module.run((upstream.html_path,) if upstream else ('newsletter.html',))
+    return module.main(checkpoint=checkpoint)
+
+def run_pipeline(checkpoint=True, trace_memory=True, from_stage=None, only_stage=None, manifest_file=MANIFEST_FILE, profile=None):
+    # Runs the stages in this interpreter, handing articles and summaries over in memory.
+    # With checkpoints on, the manifest lets a rerun skip stages whose inputs are unchanged and resume
+    # interrupted stages after their last finished item. from_stage/only_stage force the selected stages
+    # to run and take everything before them from the checkpoint files.
+    # profile is a list of stage names to run under cProfile (an empty list profiles every stage).
+    manifest = PipelineManifest(manifest_file) if checkpoint else None
+    if manifest is None or not manifest.data['stages']:
+        # A resumed run keeps adding to the run report of the run it continues
+        metrics.start_run()
+    if only_stage:
+        selected = [only_stage]
+    elif from_stage:
+        selected = STAGE_NAMES[STAGE_NAMES.index(from_stage):]
+    else:
+        selected = STAGE_NAMES
+    forced = bool(from_stage or only_stage)
+
+    timer = StageTimer(trace_memory)
+    modules = {stage['name']: load_stage(stage['script']) for stage in STAGES if stage['name'] in selected}
+    upstream = None
+    try:
+        for stage in STAGES:
+            name = stage['name']
+            if name not in selected:
+                upstream = None
+                continue
+            input_hash = stage_input_hash(stage, manifest) if manifest else None
+            if manifest and not forced and stage_outputs(stage) and manifest.is_complete(name, input_hash, stage_outputs(stage)):
+                print(f"Skipping stage {name} (inputs unchanged since it last completed)")
+                upstream = None
+                continue
+
+            # An interrupted stage has part of its output only on disk, so the next stage reads the files
+            resumed = bool(manifest and manifest.was_interrupted(name))
+            if manifest:
+                manifest.start(name)
+            progress = manifest.progress(name) if manifest else None
+            if profile is not None and (not profile or name in profile):
+                result = timer.run(name, metrics.profile_call, name, call_stage, modules[name], name, upstream, checkpoint, progress)
+            else:
+                result = timer.run(name, call_stage, modules[name], name, upstream, checkpoint, progress)
+            upstream = None if resumed else result
+            if name == 'fetch' and result is not None:
+                print(f"{len(result)} articles passed the keyword and duplicate filters")
+
+            if manifest:
+                if name == 'cleanup':
+                    # The intermediate files are archived, so the next run starts from scratch
+                    manifest.reset()
+                else:
+                    # Hash the inputs as the stage left them (rating writes scores into the store or articles_text/)
+                    manifest.complete(name, stage_input_hash(stage, manifest), stage_outputs(stage))
+    finally:
+        timer.report()
+        metrics.report_pipeline(timer.stages)
+        if 'fetch' in modules and modules['fetch'].dedup_index:
+            modules['fetch'].dedup_index.close()
+    return timer.stages
@@ -0,0 +1,142 @@
+import re
+import math
+import time
+import zlib
+import sqlite3
+import threading
+import numpy as np
+
+# 特征哈希的维度：向量不依赖固定词表，跨运行持久化后仍可直接比较
+DIMENSIONS = 1 << 18
+WORD_PATTERN = re.compile(r'[a-z0-9]{2,}')
+CJK_RUN_PATTERN = re.compile(r'[぀-ヿ㐀-鿿가-힯]+')
+
+def tokenize(text):
+    # 拉丁文字按单词切分，中日韩文字取相邻两字（单字的片段保留单字）
+    text = text.lower()
+    tokens = WORD_PATTERN.findall(text)
+    for run in CJK_RUN_PATTERN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+def vectorize(text):
+    # 稀疏词频向量：(维度下标, 1 + log(tf))，下标按 crc32 哈希，与进程无关
+    counts = {}
+    for token in tokenize(text):
+        index = zlib.crc32(token.encode('utf-8')) & (DIMENSIONS - 1)
+        counts[index] = counts.get(index, 0) + 1
+    indices = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+    values = np.fromiter((1 + math.log(count) for count in counts.values()), dtype=np.float32, count=len(counts))
+    return indices, values
+
+class PreRanker:
+    # 评分前的本地相关性预排序：TF-IDF 余弦相似度，查询为评分标准（加关键字）与历史高分文章的质心。
+    # 向量按正文哈希保存在 SQLite 中，每篇文章只向量化一次
+    def __init__(self, path, retention_days=90):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS vectors (
+                key TEXT PRIMARY KEY,
+                indices BLOB,
+                vector_values BLOB,
+                created_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS scores (
+                key TEXT PRIMARY KEY,
+                score REAL
+            );
+        """)
+        cutoff = time.time() - retention_days * 86400
+        self.conn.execute("DELETE FROM scores WHERE key IN (SELECT key FROM vectors WHERE created_at < ?)", (cutoff,))
+        self.conn.execute("DELETE FROM vectors WHERE created_at < ?", (cutoff,))
+        self.conn.commit()
+
+    def add(self, items):
+        # items: [(key, text)]；只为尚未保存的文章计算向量，并在一个事务中批量写入
+        with self.lock:
+            known = {row[0] for row in self.conn.execute("SELECT key FROM vectors")}
+        new_rows = []
+        for key, text in items:
+            if key in known:
+                continue
+            known.add(key)
+            indices, values = vectorize(text)
+            new_rows.append((key, indices.tobytes(), values.tobytes(), time.time()))
+        if new_rows:
+            with self.lock:
+                self.conn.executemany("INSERT OR REPLACE INTO vectors (key, indices, vector_values, created_at) VALUES (?, ?, ?, ?)", new_rows)
+                self.conn.commit()
+        return len(new_rows)
+
+    def record_scores(self, scores):
+        # scores: {key: 评分}，高分文章成为之后排序的正样本
+        with self.lock:
+            self.conn.executemany("INSERT OR REPLACE INTO scores (key, score) VALUES (?, ?)", list(scores.items()))
+            self.conn.commit()
+
+    def load(self):
+        # 返回 ({key: 文章序号}, 下标数组, 值数组, 文章序号数组)，用于一次性批量计算
+        with self.lock:
+            rows = self.conn.execute("SELECT key, indices, vector_values FROM vectors").fetchall()
+        positions = {}
+        indices, values, doc_ids = [], [], []
+        for position, (key, index_blob, value_blob) in enumerate(rows):
+            positions[key] = position
+            doc_indices = np.frombuffer(index_blob, dtype=np.int32)
+            indices.append(doc_indices)
+            values.append(np.frombuffer(value_blob, dtype=np.float32))
+            doc_ids.append(np.full(len(doc_indices), position, dtype=np.int32))
+        if not rows:
+            empty = np.zeros(0, dtype=np.int32)
+            return positions, empty, np.zeros(0, dtype=np.float32), empty
+        return positions, np.concatenate(indices), np.concatenate(values), np.concatenate(doc_ids)
+
+    def rank(self, items, criteria, positive_score=7):
+        # items: [(key, text)]；返回 {key: 相似度}，取值 0~1
+        self.add(items)
+        positions, indices, values, doc_ids = self.load()
+        count = len(positions)
+        if not count:
+            return {}
+
+        # 以全部已保存的文章计算 IDF
+        df = np.bincount(indices, minlength=DIMENSIONS)
+        idf = (np.log((1 + count) / (1 + df)) + 1).astype(np.float32)
+        weights = values * idf[indices]
+        norms = np.sqrt(np.bincount(doc_ids, weights=weights * weights, minlength=count))
+        norms[norms == 0] = 1
+
+        # 查询向量：评分标准文本，加上历史高分文章归一化向量的质心
+        query = np.zeros(DIMENSIONS, dtype=np.float32)
+        criteria_indices, criteria_values = vectorize(criteria)
+        if len(criteria_indices):
+            criteria_weights = criteria_values * idf[criteria_indices]
+            query[criteria_indices] += criteria_weights / np.linalg.norm(criteria_weights)
+        with self.lock:
+            positive_keys = [row[0] for row in self.conn.execute("SELECT key FROM scores WHERE score >= ?", (positive_score,))]
+        positive_ids = np.array([positions[key] for key in positive_keys if key in positions], dtype=np.int32)
+        if len(positive_ids):
+            mask = np.isin(doc_ids, positive_ids)
+            centroid = np.zeros(DIMENSIONS, dtype=np.float32)
+            np.add.at(centroid, indices[mask], weights[mask] / norms[doc_ids[mask]])
+            query += centroid / max(np.linalg.norm(centroid), 1e-9)
+        query_norm = np.linalg.norm(query)
+        if not query_norm:
+            return {key: 0.0 for key, _ in items}
+        query /= query_norm
+
+        similarities = np.bincount(doc_ids, weights=weights * query[indices], minlength=count) / norms
+        return {key: float(similarities[positions[key]]) for key, _ in items}
+
+def select(similarities, top_k, min_similarity):
+    # 保留相似度最高的 top_k 篇以及相似度不低于阈值的文章；两者都为 0 时全部保留
+    if not top_k and not min_similarity:
+        return set(similarities)
+    ranked = sorted(similarities, key=similarities.get, reverse=True)
+    keep = set(ranked[:top_k]) if top_k else set()
+    if min_similarity:
+        keep.update(key for key in ranked if similarities[key] >= min_similarity)
+    return keep
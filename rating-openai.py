@@ -1,19 +1,43 @@
 import os
 import json
+import time
 import requests
-import shutil
+import http_client
+import metrics
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from datetime import datetime
 import re
+from llm_client import chat_completion, report_cache, get_usage
+from token_budget import fit_to_budget, count_tokens
+from stage_types import Article, RatingResult
+from stage_manifest import hash_parts
+from article_store import open_article_store
 
 # 加载环境变量
 load_dotenv()
 
-# 设置自定义API端点和密钥
-CUSTOM_API_URL = os.getenv("CUSTOM_API_URL")
-API_KEY = os.getenv("API_KEY")
 RATING_CRITERIA = os.getenv("RATING_CRITERIA")
 TOP_ARTICLES = int(os.getenv("TOP_ARTICLES", 5))
+RATING_WORKERS = int(os.getenv("RATING_WORKERS", 4))  # 并发评分的线程数
+RATING_MODE = os.getenv("RATING_MODE", "single")  # single：每篇一个请求；batch：多篇合并为一个请求
+RATING_BATCH_TOKENS = int(os.getenv("RATING_BATCH_TOKENS", 6000))  # 批量评分时每个请求的文章 token 预算
+RATING_INPUT_TOKENS = int(os.getenv("RATING_INPUT_TOKENS", 4000))  # 单篇文章提交评分的 token 上限
+TRUNCATION_STRATEGY = os.getenv("TRUNCATION_STRATEGY", "head_tail")  # head_tail 或 salient
+KEYWORDS = os.getenv("KEYWORDS", "").split(',')
+RATING_PRERANK = os.getenv("RATING_PRERANK", "false").lower() == "true"  # 评分前用本地 TF-IDF 相似度筛选文章（需要 numpy）
+PRERANK_TOP_K = int(os.getenv("PRERANK_TOP_K", 30))  # 预排序后至少提交评分的文章数，0 表示不按名次保留
+PRERANK_MIN_SIMILARITY = float(os.getenv("PRERANK_MIN_SIMILARITY", 0))  # 相似度不低于此值的文章也提交评分，0 表示不按阈值保留
+PRERANK_POSITIVE_SCORE = float(os.getenv("PRERANK_POSITIVE_SCORE", 7))  # 评分不低于此值的文章作为之后预排序的正样本
+PRERANK_INDEX_FILE = os.getenv("PRERANK_INDEX_FILE", "prerank_index.db")
+PRERANK_RETENTION_DAYS = float(os.getenv("PRERANK_RETENTION_DAYS", 90))
+ARTICLES_TEXT_EXPORT = os.getenv("ARTICLES_TEXT_EXPORT", "false").lower() == "true"  # 使用文章库时仍写出 .txt 文件
+
+pre_ranker = None
+
+# 文章库：评分写入 score 列，不再改写和复制文本文件
+article_store = open_article_store()
+writes_text = article_store is None or ARTICLES_TEXT_EXPORT
 
 def read_article(file_path):
     # 读取文章内容
@@ -40,13 +64,22 @@ def replace_score(content, new_score):
     else:
         return content + f"\n\n{new_score_line}"
 
+def remove_score(content):
+    # 去掉之前追加的评分行，保证同一篇文章每次提交给 API 的内容完全相同（可命中响应缓存）
+    score_pattern = re.compile(r'\n*Article Score: (\d+(\.\d+)?)\s*out of 10\nRated on: [^\n]+')
+    return score_pattern.sub('', content)
+
+def prepare_content(filename, content):
+    # 去掉旧评分并把文章压缩到 token 预算以内
+    return fit_to_budget(remove_score(content), RATING_INPUT_TOKENS, TRUNCATION_STRATEGY, KEYWORDS, label=filename)
+
+RATING_PATTERN = re.compile(r'(\d+(\.\d+)?)\s*out of 10')
+
+def is_valid_rating(raw_rating):
+    return raw_rating.strip().lower() == "not relevant" or RATING_PATTERN.search(raw_rating)
+
 def get_article_rating(content):
     # 获取文章评分
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}"
-    }
-    
     payload = {
         "model": "gpt-3.5-turbo",
         "messages": [
@@ -56,13 +89,11 @@ def get_article_rating(content):
     }
     
     try:
-        response = requests.post(CUSTOM_API_URL, headers=headers, json=payload)
-        response.raise_for_status()
-        raw_rating = response.json()['choices'][0]['message']['content'].strip()
+        raw_rating = chat_completion(payload, is_valid_rating)['choices'][0]['message']['content'].strip()
         print(f"Raw rating response: {raw_rating}")  # Add this line for debugging
         if raw_rating.lower() == "not relevant":
             return None
-        match = re.search(r'(\d+(\.\d+)?)\s*out of 10', raw_rating)
+        match = RATING_PATTERN.search(raw_rating)
         if match:
             return f"{match.group(1)}"
         else:
@@ -72,52 +103,276 @@ def get_article_rating(content):
         print(f"Error getting rating: {e}")
         return None
 
-def main():
-    articles_dir = 'articles_text'  # 文章目录
-    high_rated_dir = 'high_rated_articles'  # 高评分文章目录
-    results = {}  # 存储结果
-    scores = []  # 存储评分
-
-    # 确保高评分文章目录存在
-    os.makedirs(high_rated_dir, exist_ok=True)
-
-    for filename in os.listdir(articles_dir):
-        if filename.endswith('.txt'):
-            file_path = os.path.join(articles_dir, filename)
-            print(f"Processing {filename}...")
-            
-            content = read_article(file_path)
-            
-            # 获取新的评分
-            rating = get_article_rating(content)
-            
-            if rating:
-                score = float(rating)
-                updated_content = replace_score(content, rating)
-                write_article(file_path, updated_content)
-                
-                results[filename] = score
-                scores.append((filename, score))
-                print(f"Rating for {filename}: {rating} out of 10")
-            else:
-                print(f"Failed to get rating for {filename}")
+def parse_batch_ratings(raw_ratings, article_ids):
+    # 解析批量评分返回的 JSON，返回 {文章编号: 评分或 None}；格式错误返回 None
+    text = re.sub(r'^```(?:json)?\s*|\s*```$', '', raw_ratings.strip())
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    ratings = {}
+    for article_id in article_ids:
+        value = data.get(article_id, '')
+        if value is None:
+            ratings[article_id] = None  # Not relevant
+        elif isinstance(value, (int, float)) and 1 <= value <= 10:
+            ratings[article_id] = f"{value:g}"
+        # 缺失或无效的评分留给单篇评分兜底
+    return ratings
+
+def get_batch_ratings(articles):
+    # 一个请求评分多篇文章，articles 为 [(文章编号, 内容)]
+    articles_text = '\n\n'.join(f"=== Article {article_id} ===\n{content}" for article_id, content in articles)
+    payload = {
+        "model": "gpt-3.5-turbo",
+        "messages": [
+            {"role": "system", "content": f"You are an AI assistant that rates articles strictly based on the criteria: '{RATING_CRITERIA}'. For each article, first determine if it strictly matches the criteria. If it does not, its score is null. If it matches, rate the article based on its value with a number from 1 to 10. Respond only with a JSON object mapping each article id to its score, for example {{\"1\": 7, \"2\": null}}."},
+            {"role": "user", "content": f"Rate the following articles:\n\n{articles_text}"}
+        ]
+    }
+    
+    try:
+        article_ids = [article_id for article_id, _ in articles]
+        raw_ratings = chat_completion(payload, lambda text: parse_batch_ratings(text, article_ids) is not None)['choices'][0]['message']['content']
+        print(f"Raw batch rating response: {raw_ratings}")
+        ratings = parse_batch_ratings(raw_ratings, article_ids)
+        if ratings is None:
+            print(f"Malformed batch rating response: {raw_ratings}")
+        return ratings
+    except requests.RequestException as e:
+        print(f"Error getting batch rating: {e}")
+        return None
+
+def save_rating(article, rating, articles_dir=None):
+    # 评分写回内存中的文章；articles_dir 为空时不保存到文章库或文件
+    if rating:
+        article.text = replace_score(article.text, rating)
+        article.score = float(rating)
+        if articles_dir and article_store and article.id is not None:
+            article_store.set_score(article.id, article.score)
+        if articles_dir and writes_text:
+            write_article(os.path.join(articles_dir, article.filename), article.text)
+        print(f"Rating for {article.filename}: {rating} out of 10")
+    else:
+        print(f"Failed to get rating for {article.filename}")
+
+def load_articles(articles_dir):
+    # 单独运行本脚本时，从 articles_text/ 读取上一阶段的输出
+    filenames = [filename for filename in os.listdir(articles_dir) if filename.endswith('.txt')]
+    return [Article(filename, read_article(os.path.join(articles_dir, filename))) for filename in filenames]
+
+def rate_article(article, articles_dir=None):
+    # 评分单篇文章，返回 (文件名, 评分, 耗时秒数)
+    print(f"Processing {article.filename}...")
+    
+    # 获取新的评分
+    start_time = time.perf_counter()
+    rating = get_article_rating(prepare_content(article.filename, article.text))
+    latency = time.perf_counter() - start_time
+    metrics.observe('rate_article', latency)
+    if not rating:
+        metrics.count('rating_errors')
+    
+    save_rating(article, rating, articles_dir)
+    return article.filename, rating, latency
+
+def make_batches(articles):
+    # 按 token 预算把文章分组（单篇按 RATING_INPUT_TOKENS 截断后计）；没有 tiktoken 时 count_tokens 按中日韩字符一个 token 估算
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for article in articles:
+        tokens = min(count_tokens(remove_score(article.text)), RATING_INPUT_TOKENS)
+        if batch and batch_tokens + tokens > RATING_BATCH_TOKENS:
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(article)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+def rate_batch(articles, articles_dir=None):
+    # 批量评分一组文章，返回每篇的 (文件名, 评分, 耗时秒数)；响应异常的文章退回单篇评分
+    print(f"Processing batch of {len(articles)} articles...")
+    article_ids = {str(i): article for i, article in enumerate(articles, start=1)}
+
+    start_time = time.perf_counter()
+    ratings = get_batch_ratings([(article_id, prepare_content(article.filename, article.text)) for article_id, article in article_ids.items()]) or {}
+    latency = time.perf_counter() - start_time
+    metrics.observe('rate_batch', latency)
+
+    outcomes = []
+    for article_id, article in article_ids.items():
+        if article_id in ratings:
+            save_rating(article, ratings[article_id], articles_dir)
+            outcomes.append((article.filename, ratings[article_id], latency))
+        else:
+            print(f"No valid batch score for {article.filename}, falling back to single rating")
+            metrics.count('rating_batch_fallbacks')
+            outcomes.append(rate_article(article, articles_dir))
+    return outcomes
+
+def write_rating_stats(outcomes, elapsed, usage, stats_file='rating_stats.json'):
+    # 输出每篇文章的耗时、整体吞吐量以及 token 用量
+    latencies = sorted(latency for _, _, latency in outcomes)
+    rated = sum(1 for _, rating, _ in outcomes if rating)
+    total_tokens = usage['prompt_tokens'] + usage['completion_tokens']
+    stats = {
+        "mode": RATING_MODE,
+        "articles": len(outcomes),
+        "rated": rated,
+        "failed": len(outcomes) - rated,
+        "workers": RATING_WORKERS,
+        "api_requests": usage['requests'],
+        "cache_hits": usage['cache_hits'],
+        "prompt_tokens": usage['prompt_tokens'],
+        "completion_tokens": usage['completion_tokens'],
+        "tokens_per_article": round(total_tokens / len(outcomes), 1) if outcomes else 0,
+        "requests_per_article": round(usage['requests'] / len(outcomes), 3) if outcomes else 0,
+        "wall_time_seconds": round(elapsed, 3),
+        "articles_per_minute": round(len(outcomes) / elapsed * 60, 2) if elapsed else 0,
+        "latency_seconds": {
+            "mean": round(sum(latencies) / len(latencies), 3) if latencies else 0,
+            "p50": round(latencies[len(latencies) // 2], 3) if latencies else 0,
+            "p95": round(latencies[int(len(latencies) * 0.95)], 3) if latencies else 0,
+            "max": round(latencies[-1], 3) if latencies else 0
+        },
+        "per_article_latency_seconds": {filename: round(latency, 3) for filename, _, latency in outcomes}
+    }
+    with open(stats_file, 'w', encoding='utf-8') as f:
+        json.dump(stats, f, ensure_ascii=False, indent=4)
+    print(f"Rated {len(outcomes)} articles in {elapsed:.1f}s ({stats['articles_per_minute']} articles/min, "
+          f"mean latency {stats['latency_seconds']['mean']}s, p95 {stats['latency_seconds']['p95']}s)")
+    print(f"Rating mode {RATING_MODE}: {usage['requests']} API requests, {stats['tokens_per_article']} tokens per article")
+    print(f"Rating stats saved to {stats_file}")
+
+def rating_hash(article):
+    # 评分只取决于去掉旧评分后的正文和评分标准
+    return hash_parts(remove_score(article.text), RATING_CRITERIA, RATING_INPUT_TOKENS, TRUNCATION_STRATEGY)
+
+def prerank_key(article):
+    return hash_parts(remove_score(article.text))
+
+def get_pre_ranker():
+    # numpy 只在开启预排序时才需要
+    global pre_ranker
+    if pre_ranker is None:
+        from prerank import PreRanker
+        pre_ranker = PreRanker(PRERANK_INDEX_FILE, PRERANK_RETENTION_DAYS)
+    return pre_ranker
+
+def prerank_articles(articles):
+    # 只把与评分标准及历史高分文章最相似的文章交给 API 评分，其余文章本次不评分
+    from prerank import select
+    keys = {article.filename: prerank_key(article) for article in articles}
+    query = ' '.join([RATING_CRITERIA or ''] + [keyword for keyword in KEYWORDS if keyword])
+    with metrics.timer('prerank'):
+        similarities = get_pre_ranker().rank([(keys[article.filename], remove_score(article.text)) for article in articles], query, PRERANK_POSITIVE_SCORE)
+    keep = select({article.filename: similarities.get(keys[article.filename], 0.0) for article in articles}, PRERANK_TOP_K, PRERANK_MIN_SIMILARITY)
+    kept = [article for article in articles if article.filename in keep]
+    metrics.count('articles_prerank_skipped', len(articles) - len(kept))
+    print(f"Pre-ranking kept {len(kept)} of {len(articles)} articles for rating")
+    return kept
+
+def record_prerank_scores(articles):
+    get_pre_ranker().record_scores({prerank_key(article): article.score for article in articles if article.score is not None})
+
+def run(articles=None, articles_dir='articles_text', high_rated_dir='high_rated_articles', checkpoint=True, progress=None):
+    # 供进程内流水线调用：articles 为上一阶段交来的文章，为 None 时从 articles_dir 读取
+    # checkpoint 为 False 时评分和高评分文章只保存在返回值中，不写任何文件
+    # progress 为流水线清单中本阶段的记录，内容未变的文章直接沿用上次的评分
+    # 使用文章库时只查询当前一期尚未评分的文章，前 TOP_ARTICLES 篇也从文章库中按评分查询
+    use_store = checkpoint and article_store is not None
+    if articles is None:
+        articles = article_store.unrated() if use_store else load_articles(articles_dir)
+    write_dir = articles_dir if checkpoint else None
+    result = RatingResult()
+
+    pending = []
+    for article in articles:
+        if article.score is not None:
+            # 文章库中正文未变的文章保留了上次的评分
+            result.ratings[article.filename] = article.score
+            continue
+        rating = progress.get(article.filename, rating_hash(article)) if progress else None
+        if rating:
+            article.score = float(rating)
+            if not extract_score(article.text):
+                save_rating(article, rating, write_dir)
+            result.ratings[article.filename] = article.score
+        else:
+            pending.append(article)
+    if len(pending) < len(articles):
+        print(f"Reusing {len(articles) - len(pending)} earlier ratings")
+    if RATING_PRERANK and pending:
+        pending = prerank_articles(pending)
+
+    def record(outcome, article):
+        # 评分写回文件后才记录，中断后从下一篇继续
+        if progress and outcome[1]:
+            progress.record(article.filename, rating_hash(article), outcome[1])
+        return outcome
+
+    def rate_and_record_batch(batch):
+        return [record(outcome, article) for outcome, article in zip(rate_batch(batch, write_dir), batch)]
+
+    # 并发评分，速率限制由 llm_client 统一处理
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=RATING_WORKERS) as executor:
+        if RATING_MODE == 'batch':
+            outcomes = [outcome for batch_outcomes in executor.map(rate_and_record_batch, make_batches(pending)) for outcome in batch_outcomes]
+        else:
+            outcomes = list(executor.map(lambda article: record(rate_article(article, write_dir), article), pending))
+    elapsed = time.perf_counter() - start_time
+
+    for filename, rating, _ in outcomes:
+        if rating:
+            result.ratings[filename] = float(rating)
+    if RATING_PRERANK:
+        record_prerank_scores(pending)
 
     # 按评分排序并选择前 TOP_ARTICLES 篇文章
-    scores.sort(key=lambda x: x[1], reverse=True)
-    top_articles = scores[:TOP_ARTICLES]
-
-    # 复制前 TOP_ARTICLES 篇高评分文章
-    for filename, score in top_articles:
-        src = os.path.join(articles_dir, filename)
-        dst = os.path.join(high_rated_dir, filename)
-        shutil.copy2(src, dst)
-        print(f"Copied {filename} to high_rated_articles (Score: {score})")
-
-    # 将结果保存到JSON文件
-    with open('article_ratings.json', 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=4)
-    print("Ratings saved to article_ratings.json")
-    print(f"High-rated articles copied to {high_rated_dir}")
+    if use_store:
+        result.ratings = article_store.ratings()
+        result.top_articles = article_store.top(TOP_ARTICLES)
+    else:
+        rated = sorted((article for article in articles if article.score is not None), key=lambda article: article.score, reverse=True)
+        result.top_articles = rated[:TOP_ARTICLES]
+
+    if checkpoint and writes_text:
+        # 确保高评分文章目录存在
+        os.makedirs(high_rated_dir, exist_ok=True)
+        # 重新运行时移除已跌出前 TOP_ARTICLES 的旧文件
+        top_filenames = {article.filename for article in result.top_articles}
+        for filename in os.listdir(high_rated_dir):
+            if filename.endswith('.txt') and filename not in top_filenames:
+                os.remove(os.path.join(high_rated_dir, filename))
+
+        # 写出前 TOP_ARTICLES 篇高评分文章
+        for article in result.top_articles:
+            write_article(os.path.join(high_rated_dir, article.filename), article.text)
+            print(f"Copied {article.filename} to high_rated_articles (Score: {article.score})")
+
+    if checkpoint:
+        # 将结果保存到JSON文件
+        with open('article_ratings.json', 'w', encoding='utf-8') as f:
+            json.dump(result.ratings, f, ensure_ascii=False, indent=4)
+        print("Ratings saved to article_ratings.json")
+        if writes_text:
+            print(f"High-rated articles copied to {high_rated_dir}")
+
+        write_rating_stats(outcomes, elapsed, get_usage())
+    report_cache()
+    http_client.report('rate')
+    metrics.report('rate')
+    return result
+
+def main():
+    run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,6 +1,9 @@
 import os
-from playwright.sync_api import sync_playwright
-from PIL import Image
+import json
+import asyncio
+import argparse
+import metrics
+from playwright.async_api import async_playwright
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -8,50 +11,159 @@ load_dotenv()
 
 # Get width from environment variable
 WIDTH = int(os.getenv('WIDTH', 800))
-DEVICE_PIXEL_RATIO = 2  # Set device pixel ratio for HiDPI
-
-def render_html_to_png(html_file_path, output_png_path):
-    with sync_playwright() as p:
-        browser = p.chromium.launch()
-        page = browser.new_page(device_scale_factor=DEVICE_PIXEL_RATIO)
-        
-        # Set viewport size
-        page.set_viewport_size({"width": WIDTH, "height": 1000})
-        
-        # Navigate to the HTML file
-        page.goto(f"file://{os.path.abspath(html_file_path)}")
-        
-        # Add padding and increase font size
-        page.evaluate("""() => {
-            document.body.style.padding = '40px';
-            document.body.style.fontSize = '24px';
-            document.body.style.boxSizing = 'border-box';
-        }""")
-        
-        # Wait for any animations or dynamic content to load
-        page.wait_for_load_state("networkidle")
-        
-        # Get the full height of the page
-        height = page.evaluate("document.documentElement.scrollHeight")
-        
-        # Update viewport to match full page height
-        page.set_viewport_size({"width": WIDTH, "height": height})
-        
-        # Capture screenshot
-        screenshot = page.screenshot(full_page=True)
-        
-        browser.close()
-    
-    # Save the screenshot
-    with open(output_png_path, 'wb') as f:
-        f.write(screenshot)
-    
-    # Optionally, crop the image to remove any extra space
-    image = Image.open(output_png_path)
-    image = image.crop((0, 0, WIDTH * DEVICE_PIXEL_RATIO, height * DEVICE_PIXEL_RATIO))
-    image.save(output_png_path)
+DEVICE_PIXEL_RATIO = int(os.getenv('DEVICE_PIXEL_RATIO', 2))  # Set device pixel ratio for HiDPI
+RENDER_POOL_SIZE = int(os.getenv('RENDER_POOL_SIZE', 2))  # Number of pages rendering at once
+RENDER_SEGMENT_MAX_HEIGHT = int(os.getenv('RENDER_SEGMENT_MAX_HEIGHT', 0))  # Max PNG height in pixels per segment, 0 renders one image
+
+def plan_segments(article_tops, page_height, max_height):
+    # Cut only at .article boundaries (the top of the next article) unless a single article is taller than max_height
+    cut_points = sorted(top for top in article_tops if 0 < top < page_height) + [page_height]
+    segments = []
+    start = 0
+    while start < page_height:
+        fitting = [point for point in cut_points if start < point <= start + max_height]
+        end = fitting[-1] if fitting else min(start + max_height, page_height)
+        segments.append((start, end))
+        start = end
+    return segments
+
+class RenderService:
+    # Keeps one Chromium alive and renders many HTML files/widths through a pool of pages
+    def __init__(self, pool_size=RENDER_POOL_SIZE, device_scale_factor=DEVICE_PIXEL_RATIO):
+        self.pool_size = pool_size
+        self.device_scale_factor = device_scale_factor
+        self.playwright = None
+        self.browser = None
+        self.pages = None
+
+    async def __aenter__(self):
+        self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch()
+        context = await self.browser.new_context(device_scale_factor=self.device_scale_factor)
+        self.pages = asyncio.Queue()
+        for _ in range(self.pool_size):
+            await self.pages.put(await context.new_page())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.browser.close()
+        await self.playwright.stop()
+
+    async def render(self, html_file_path, output_png_path, width=WIDTH, segment_max_height=RENDER_SEGMENT_MAX_HEIGHT):
+        with metrics.timer('render'):
+            return await self.render_page(html_file_path, output_png_path, width, segment_max_height)
+
+    async def render_page(self, html_file_path, output_png_path, width, segment_max_height):
+        page = await self.pages.get()
+        try:
+            # Set viewport size
+            await page.set_viewport_size({"width": width, "height": 1000})
+
+            # Navigate to the HTML file
+            await page.goto(f"file://{os.path.abspath(html_file_path)}")
+
+            # Add padding and increase font size
+            await page.evaluate("""() => {
+                document.body.style.padding = '40px';
+                document.body.style.fontSize = '24px';
+                document.body.style.boxSizing = 'border-box';
+            }""")
+
+            # Wait for any animations or dynamic content to load
+            await page.wait_for_load_state("networkidle")
+
+            # Get the full height of the page
+            height = await page.evaluate("document.documentElement.scrollHeight")
+
+            if segment_max_height:
+                return await self.render_segments(page, html_file_path, output_png_path, width, height, segment_max_height)
+
+            # Update viewport to match full page height
+            await page.set_viewport_size({"width": width, "height": height})
+
+            # Capture the screenshot already cropped to the page area, so the bytes are written once
+            screenshot = await page.screenshot(full_page=True, clip={"x": 0, "y": 0, "width": width, "height": height})
+        finally:
+            await self.pages.put(page)
+
+        with open(output_png_path, 'wb') as f:
+            f.write(screenshot)
+        metrics.count('png_bytes', len(screenshot))
+        print(f"Rendered {html_file_path} at width {width}: {output_png_path}")
+        return output_png_path
+
+    async def render_segments(self, page, html_file_path, output_png_path, width, height, segment_max_height):
+        # Capture each segment by clip region so the full-page bitmap is never built
+        article_tops = await page.evaluate("""() => Array.from(document.querySelectorAll('.article'))
+            .map(element => element.getBoundingClientRect().top + window.scrollY)""")
+        segments = plan_segments(article_tops, height, max(1, segment_max_height // self.device_scale_factor))
+
+        stem = os.path.splitext(output_png_path)[0]
+        segments_dir = f"{stem}_segments"
+        os.makedirs(segments_dir, exist_ok=True)
+        manifest = {"source": html_file_path, "width": width, "device_pixel_ratio": self.device_scale_factor, "segments": []}
+        for index, (top, bottom) in enumerate(segments, start=1):
+            segment_path = os.path.join(segments_dir, f"part_{index:02d}.png")
+            screenshot = await page.screenshot(full_page=True, clip={"x": 0, "y": top, "width": width, "height": bottom - top})
+            with open(segment_path, 'wb') as f:
+                f.write(screenshot)
+            metrics.count('png_bytes', len(screenshot))
+            manifest["segments"].append({
+                "file": os.path.basename(segment_path),
+                "top": round(top),
+                "height": round(bottom - top),
+                "pixel_height": round((bottom - top) * self.device_scale_factor),
+                "articles": sum(1 for article_top in article_tops if top <= article_top < bottom)
+            })
+
+        manifest_path = os.path.join(segments_dir, "manifest.json")
+        with open(manifest_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=4)
+        print(f"Rendered {len(segments)} segments at width {width}: {segments_dir}")
+        return manifest_path
+
+    async def render_many(self, jobs, segment_max_height=RENDER_SEGMENT_MAX_HEIGHT):
+        # jobs: iterable of (html_file_path, output_png_path, width)
+        return await asyncio.gather(*(self.render(*job, segment_max_height=segment_max_height) for job in jobs))
+
+async def render_jobs(jobs, pool_size=RENDER_POOL_SIZE, segment_max_height=RENDER_SEGMENT_MAX_HEIGHT):
+    async with RenderService(pool_size) as service:
+        return await service.render_many(jobs, segment_max_height)
+
+def render_html_to_png(html_file_path, output_png_path, width=WIDTH):
+    asyncio.run(render_jobs([(html_file_path, output_png_path, width)], pool_size=1))
+
+def build_jobs(html_files, widths, output_dir):
+    jobs = []
+    for html_file_path in html_files:
+        stem = os.path.splitext(os.path.basename(html_file_path))[0]
+        for width in widths:
+            # Only add the width to the name when several widths are rendered
+            name = f"{stem}.png" if len(widths) == 1 else f"{stem}_{width}.png"
+            jobs.append((html_file_path, os.path.join(output_dir, name), width))
+    return jobs
+
+def run(html_files=("newsletter.html",), widths=(WIDTH,), output_dir='.'):
+    # In-process entry point with the same defaults as the CLI; returns the written PNG (or manifest) paths
+    os.makedirs(output_dir, exist_ok=True)
+    paths = asyncio.run(render_jobs(build_jobs(list(html_files), list(widths), output_dir)))
+    metrics.report('render')
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Render HTML newsletters to PNG with one shared browser")
+    parser.add_argument('html_files', nargs='*', default=["newsletter.html"], help="HTML files to render (default: newsletter.html)")
+    parser.add_argument('--widths', default=str(WIDTH), help="comma-separated viewport widths (default: WIDTH)")
+    parser.add_argument('--output-dir', default='.', help="directory for the PNG files")
+    parser.add_argument('--pool-size', type=int, default=RENDER_POOL_SIZE, help="number of pages rendering at once")
+    parser.add_argument('--segment-max-height', type=int, default=RENDER_SEGMENT_MAX_HEIGHT,
+                        help="split the output at .article boundaries into PNGs at most this many pixels tall (0 = one PNG)")
+    args = parser.parse_args()
+
+    widths = [int(width) for width in args.widths.split(',') if width.strip()]
+    os.makedirs(args.output_dir, exist_ok=True)
+    asyncio.run(render_jobs(build_jobs(args.html_files, widths, args.output_dir), args.pool_size, args.segment_max_height))
+    metrics.report('render')
 
 if __name__ == "__main__":
-    html_file_path = "newsletter.html"  # Path to your HTML file
-    output_png_path = "newsletter.png"  # Path to save the PNG file
-    render_html_to_png(html_file_path, output_png_path)
+    main()
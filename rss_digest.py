@@ -1,28 +1,77 @@
 import sys
+import calendar
+import re
+import html
+import asyncio
 import xml.etree.ElementTree as ET
 import feedparser
-import requests
+import http_client
+import metrics
 from concurrent.futures import ThreadPoolExecutor
 import csv
 import os
-from bs4 import BeautifulSoup
+import queue
+import threading
 from youtube_transcript_api import YouTubeTranscriptApi
 from urllib.parse import urlparse, parse_qs
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import opencc
+from feed_cache import FeedCache
+from dedup_index import DedupIndex, simhash
+from keyword_matcher import KeywordMatcher
+from page_store import open_page_store
+from article_store import open_article_store
+from html_extract import extract_page, extract_page_stream
+from functools import lru_cache
+from stage_types import Article
 
 # 加载环境变量
 load_dotenv()
 KEYWORDS = os.getenv("KEYWORDS").split(',')
 THREADS = int(os.getenv("THREADS", 10))
 DATE_RANGE_DAYS = int(os.getenv("DATE_RANGE_DAYS", 7))
+FEED_CACHE_FILE = os.getenv("FEED_CACHE_FILE", "feed_cache.json")
+FETCH_ENGINE = os.getenv("FETCH_ENGINE", "thread")  # thread 或 async
+ASYNC_MAX_IN_FLIGHT = int(os.getenv("ASYNC_MAX_IN_FLIGHT", 50))
+ASYNC_PER_HOST = int(os.getenv("ASYNC_PER_HOST", 4))
+STREAM_ARTICLES = os.getenv("STREAM_ARTICLES", "false").lower() == "true"
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", 100))
+ARTICLES_CSV = os.getenv("ARTICLES_CSV", "articles.csv")  # 流式模式下为可选输出，留空则不写
+DEDUP_INDEX_FILE = os.getenv("DEDUP_INDEX_FILE", "dedup_index.db")  # 留空则不去重
+DEDUP_MAX_DISTANCE = int(os.getenv("DEDUP_MAX_DISTANCE", 3))
+DEDUP_RETENTION_DAYS = int(os.getenv("DEDUP_RETENTION_DAYS", 30))
+PREFILTER_MODE = os.getenv("PREFILTER_MODE", "off").lower()  # off、strict 或 lenient
+EXTRACT_BACKEND = os.getenv("EXTRACT_BACKEND", "auto")  # auto、selectolax、lxml、bs4 或 stream
+ARTICLES_TEXT_EXPORT = os.getenv("ARTICLES_TEXT_EXPORT", "false").lower() == "true"  # 使用文章库时仍写出 articles_text/*.txt
 
 # 初始化 opencc 转换器
 cc = opencc.OpenCC('s2t')  # 简体到繁体
 cc_tw = opencc.OpenCC('s2tw')  # 简体到台湾繁体
 cc_hk = opencc.OpenCC('s2hk')  # 简体到香港繁体
 
+# 订阅源条件请求缓存（ETag / Last-Modified / 内容哈希）
+feed_cache = FeedCache(FEED_CACHE_FILE)
+
+# 跨运行的文章去重索引
+dedup_index = DedupIndex(DEDUP_INDEX_FILE, DEDUP_MAX_DISTANCE, DEDUP_RETENTION_DAYS) if DEDUP_INDEX_FILE else None
+
+# 文章页面共享存储，make_newsletter 从中读取图片候选而无需再次下载页面
+page_store = open_page_store()
+
+# 文章库：保存通过筛选的文章，评分与摘要阶段从中查询
+article_store = open_article_store()
+
+# 预过滤统计：检查过的条目数与因此省去的页面下载数
+prefilter_stats = {'checked': 0, 'skipped': 0}
+prefilter_lock = threading.Lock()
+
+# 已解析、等待提交的订阅源状态 {订阅源 URL: (状态, 条目链接)}，以及本轮下载失败的文章链接；
+# 订阅源只有在其条目全部处理成功后才记为已读取，否则下次仍完整获取以重试失败的文章
+pending_feeds = {}
+failed_urls = set()
+feed_state_lock = threading.Lock()
+
 def extract_urls_from_opml(opml_file):
     # 解析 OPML 文件
     tree = ET.parse(opml_file)
@@ -37,25 +86,119 @@ def extract_urls_from_opml(opml_file):
     
     return urls
 
-def fetch_articles_from_rss(url):
+def strip_html_tags(text):
+    return html.unescape(re.sub(r'<[^>]+>', ' ', text or ''))
+
+def should_download_entry(entry):
+    # 下载文章页面之前，先用订阅源自带的标题、摘要和正文匹配关键字
+    if PREFILTER_MODE not in ('strict', 'lenient'):
+        return True
+    summary = strip_html_tags(entry.get('summary', ''))
+    body = strip_html_tags(' '.join(item.get('value', '') for item in entry.get('content', [])))
+    matched = build_keyword_matcher(tuple(KEYWORDS)).search(' '.join([entry.get('title', ''), summary, body]))
+    if PREFILTER_MODE == 'strict':
+        # 严格模式：未命中即跳过
+        keep = matched
+    else:
+        # 宽松模式：只有订阅源带有正文且未命中时才跳过
+        keep = matched or not body.strip()
+    with prefilter_lock:
+        prefilter_stats['checked'] += 1
+        if not keep:
+            prefilter_stats['skipped'] += 1
+    if not keep:
+        metrics.count('articles_skipped_prefilter')
+        print(f"Skipping article: {entry.get('title', '')} (pre-filter: none of the keywords found in feed text)")
+    return keep
+
+def report_prefilter():
+    if PREFILTER_MODE in ('strict', 'lenient'):
+        print(f"Pre-filter ({PREFILTER_MODE}): avoided {prefilter_stats['skipped']} of {prefilter_stats['checked']} article downloads")
+
+def feed_schedule_hints(feed):
+    # 供守护模式调整轮询间隔：ttl、sy:updatePeriod/updateFrequency 以及各条目的发布时间（UTC 时间戳）
+    return {
+        'ttl': feed.feed.get('ttl'),
+        'update_period': feed.feed.get('sy_updateperiod'),
+        'update_frequency': feed.feed.get('sy_updatefrequency'),
+        'entry_times': [calendar.timegm(entry.published_parsed) for entry in feed.entries if entry.get('published_parsed')]
+    }
+
+def parse_feed_articles(content, hints=None):
+    # 解析订阅源内容，只保留日期范围内的文章；传入 hints 字典时同时填入订阅源的更新频率信息
+    articles = []
+    feed = feedparser.parse(content)
+    date_range = datetime.now() - timedelta(days=DATE_RANGE_DAYS)
+    if hints is not None:
+        hints.update(feed_schedule_hints(feed))
+    
+    for entry in feed.entries:
+        published_date = datetime(*entry.published_parsed[:6])
+        if published_date > date_range and should_download_entry(entry):
+            article = {
+                'title': entry.title,
+                'link': entry.link,
+                'date': published_date.strftime('%Y-%m-%d')
+            }
+            articles.append(article)
+    return articles
+
+def defer_feed_state(url, state, articles):
+    if state:
+        with feed_state_lock:
+            pending_feeds[url] = (state, [article['link'] for article in articles])
+
+def mark_failed(url):
+    # 只用于暂时性的错误（网络错误、超时、429/5xx），下次运行重试；没有正文的文章不算失败
+    with feed_state_lock:
+        failed_urls.add(url)
+
+def is_failed(url):
+    with feed_state_lock:
+        return url in failed_urls
+
+def commit_feed_states():
+    # 在本轮文章全部处理完后调用
+    with feed_state_lock:
+        for url, (state, links) in pending_feeds.items():
+            if not failed_urls.intersection(links):
+                feed_cache.commit(url, state)
+        pending_feeds.clear()
+        failed_urls.clear()
+
+def discard_feed_states():
+    with feed_state_lock:
+        pending_feeds.clear()
+        failed_urls.clear()
+
+def fetch_articles_from_rss(url, hints=None):
+    # hints 用法同 parse_feed_articles；订阅源未变化时 hints 保持为空，出错时写入 'error'
     articles = []
     try:
         print(f"Fetching articles from {url}...")
-        response = requests.get(url, timeout=10)
-        feed = feedparser.parse(response.content)
-        date_range = datetime.now() - timedelta(days=DATE_RANGE_DAYS)
-        
-        for entry in feed.entries:
-            published_date = datetime(*entry.published_parsed[:6])
-            if published_date > date_range:
-                article = {
-                    'title': entry.title,
-                    'link': entry.link,
-                    'date': published_date.strftime('%Y-%m-%d')
-                }
-                articles.append(article)
+        with metrics.timer('feed_fetch'):
+            response = http_client.get(url, headers=feed_cache.request_headers(url))
+        metrics.count('feed_bytes', len(response.content))
+        unchanged, state = feed_cache.check(url, response.status_code, response.headers, response.content)
+        if unchanged:
+            metrics.count('feed_cache_hits')
+            print(f"Feed unchanged, skipping: {url}")
+            if state:
+                feed_cache.commit(url, state)
+            return articles
+        metrics.count('feed_cache_misses')
+        if response.status_code >= 400:
+            metrics.count('feed_errors')
+            if hints is not None:
+                hints['error'] = f"HTTP {response.status_code}"
+        with metrics.timer('feed_parse'):
+            articles = parse_feed_articles(response.content, hints)
+        defer_feed_state(url, state, articles)
     except Exception as e:
+        metrics.count('feed_errors')
         print(f"Error fetching articles from {url}: {e}")
+        if hints is not None:
+            hints['error'] = str(e)
     return articles
 
 def fetch_all_articles(urls):
@@ -67,64 +210,119 @@ def fetch_all_articles(urls):
             articles.extend(result)
     return articles
 
+def normalize_url(url):
+    # Ensure the URL has a scheme
+    if url.startswith('//'):
+        url = 'http:' + url  # Add 'http:' prefix to URLs starting with '//'
+    elif not url.startswith(('http://', 'https://')):
+        url = 'http://' + url
+    return url
+
 def fetch_html_content(url):
     try:
-        # Ensure the URL has a scheme
-        if url.startswith('//'):
-            url = 'http:' + url  # Add 'http:' prefix to URLs starting with '//'
-        elif not url.startswith(('http://', 'https://')):
-            url = 'http://' + url
-        
         # 发送 HTTP 请求获取 HTML 内容
-        response = requests.get(url, timeout=10)
+        with metrics.timer('html_fetch'):
+            response = http_client.get(normalize_url(url))
         response.raise_for_status()
+        metrics.count('html_bytes', len(response.content))
         return response.text
     except Exception as e:
         # 捕获并打印异常
+        metrics.count('html_errors')
+        if http_client.is_transient_error(e):
+            mark_failed(url)
         print(f"Error fetching HTML content from {url}: {e}")
         return None
 
-def extract_article_content(html):
+def extract_article_page(html):
+    # 返回 {'text', 'og_image', 'first_image'}，图片候选在同一次解析中顺带取得
     try:
-        # 使用 BeautifulSoup 解析 HTML 内容
-        soup = BeautifulSoup(html, 'html.parser')
-        # 提取文章内容（假设文章内容在 <article> 标签中）
-        article = soup.find('article')
-        if article:
-            return article.get_text()
-        else:
-            return None
+        # 使用可插拔的解析后端提取文章内容（优先 <article> 标签，否则按段落启发式提取）
+        with metrics.timer('extraction'):
+            return extract_page(html, EXTRACT_BACKEND)
     except Exception as e:
         # 捕获并打印异常
+        metrics.count('extraction_errors')
         print(f"Error extracting article content: {e}")
         return None
 
-def save_article_content(title, content, url, date, folder, keywords):
-    # 转换关键字为不同的中文变体
-    keywords_traditional = [cc.convert(keyword) for keyword in keywords]
-    keywords_tw = [cc_tw.convert(keyword) for keyword in keywords]
-    keywords_hk = [cc_hk.convert(keyword) for keyword in keywords]
+def fetch_article_page_stream(url, keywords=None):
+    # 增量模式：边下载边解析，<article> 闭合后立即断开连接；传入 keywords 时正文在解析的同时做关键字匹配
+    keyword_scan = build_keyword_matcher(tuple(keywords)).scan() if keywords else None
+    try:
+        # 下载与提取交错进行，合并计为 html_fetch
+        with metrics.timer('html_fetch'), http_client.stream(normalize_url(url)) as response:
+            response.raise_for_status()
+            if response.encoding is None:
+                response.encoding = 'utf-8'
+            return extract_page_stream(response.iter_content(chunk_size=16384, decode_unicode=True), keyword_scan=keyword_scan)
+    except Exception as e:
+        metrics.count('html_errors')
+        if http_client.is_transient_error(e):
+            mark_failed(url)
+        print(f"Error fetching HTML content from {url}: {e}")
+        return None
+
+def store_page(url, html, page, article):
+    # 只保存通过关键字与去重筛选的文章页面
+    if article and page and page_store:
+        page_store.put(url, html, page)
+    return article
+
+@lru_cache(maxsize=None)
+def build_keyword_matcher(keywords):
+    # 转换关键字为不同的中文变体，只在首次使用时转换并编译一次
+    variants = list(keywords)
+    variants += [cc.convert(keyword) for keyword in keywords]  # 繁体
+    variants += [cc_tw.convert(keyword) for keyword in keywords]  # 台湾繁体
+    variants += [cc_hk.convert(keyword) for keyword in keywords]  # 香港繁体
+    return KeywordMatcher(variants)
+
+def prepare_output_folder(folder):
+    # 使用文章库且不导出文本文件时不创建 articles_text/
+    if folder and (not article_store or ARTICLES_TEXT_EXPORT):
+        os.makedirs(folder, exist_ok=True)
 
-    # 检查内容中是否包含任意一个关键字
-    if not any(keyword.lower() in content.lower() for keyword in keywords + keywords_traditional + keywords_tw + keywords_hk):
+def save_article_content(title, content, url, date, folder, keywords, matched=None):
+    # 检查内容中是否包含任意一个关键字；matched 不为 None 时表示已在流式解析中匹配过
+    if matched is None:
+        with metrics.timer('keyword_filter'):
+            matched = build_keyword_matcher(tuple(keywords)).search(content)
+    if not matched:
+        metrics.count('articles_skipped_keywords')
         print(f"Skipping article: {title} (none of the keywords found)")
-        return
+        return None
+    metrics.count('articles_saved')
 
     # 创建文件名并替换无效字符
     filename = f"{title}.txt".replace('/', '_').replace('\\', '_')
-    filepath = os.path.join(folder, filename)
+    content = '\n'.join([line for line in content.split('\n') if line.strip()])
+    article = Article(filename, f"Title: {title}\nURL: {url}\nDate: {date}\n\n{content}", url=url, title=title)
+    if not folder:
+        # 进程内运行且不写检查点时，文章只在内存中交给评分阶段
+        return article
+
+    if article_store:
+        # 文章库按 URL 保存，同标题的文章会分到不同的文件名
+        article = article_store.add(title, url, date, content)
+        if article is None:
+            metrics.count('articles_skipped_published')
+            print(f"Skipping article: {title} (already published in an earlier newsletter)")
+            return None
+        print(f"Stored article: {article.filename}")
+        if not ARTICLES_TEXT_EXPORT:
+            return article
+
+    filepath = os.path.join(folder, article.filename)
     try:
         # 文章内容写入文本文件
         with open(filepath, 'w', encoding='utf-8') as file:
-            file.write(f"Title: {title}\n")
-            file.write(f"URL: {url}\n")
-            file.write(f"Date: {date}\n\n")
-            content = '\n'.join([line for line in content.split('\n') if line.strip()])
-            file.write(content)
+            file.write(article.text)
         print(f"Saved article: {filepath}")
     except Exception as e:
         # 捕获并打印异常
         print(f"Error saving article {title}: {e}")
+    return article
 
 def get_youtube_video_id(url):
     parsed_url = urlparse(url)
@@ -142,50 +340,278 @@ def fetch_youtube_subtitles(video_id):
         print(f"Error fetching subtitles for video {video_id}: {e}")
         return None
 
+def claim_article(title, url):
+    # 已处理过的文章在任何网络请求之前跳过
+    if dedup_index and not dedup_index.claim_url(url):
+        metrics.count('articles_skipped_seen')
+        print(f"Skipping article: {title} (already processed)")
+        return False
+    return True
+
+def finish_article(title, content, url, date, output_folder, keywords, matched=None):
+    if not content:
+        if dedup_index:
+            if is_failed(url):
+                # 暂时性的下载错误，下次运行重试
+                dedup_index.release_url(url)
+            else:
+                dedup_index.mark_seen(url)
+        return None
+
+    # 近似重复的文章（如多个订阅源转载的同一篇报道）不再进入后续评分与摘要
+    if dedup_index:
+        duplicate = dedup_index.check_and_record(url, simhash(content))
+        if duplicate:
+            metrics.count('articles_skipped_duplicates')
+            print(f"Skipping article: {title} (near-duplicate of {duplicate})")
+            return None
+
+    return save_article_content(title, content, url, date, output_folder, keywords, matched)
+
 def process_single_article(row, output_folder, keywords):
     title = row['Title']
     url = row['URL']
     date = row['Date']
+    if not claim_article(title, url):
+        return None
     print(f"Processing article: {title} from {url}")
     
+    html = page = None
     video_id = get_youtube_video_id(url)
     if video_id:
-        content = fetch_youtube_subtitles(video_id)
+        with metrics.timer('subtitles'):
+            content = fetch_youtube_subtitles(video_id)
+    elif EXTRACT_BACKEND == 'stream':
+        page = fetch_article_page_stream(url, keywords)
+        content = page['text'] if page else None
     else:
         html = fetch_html_content(url)
-        content = extract_article_content(html) if html else None
+        page = extract_article_page(html) if html else None
+        content = page['text'] if page else None
     
-    if content:
-        save_article_content(title, content, url, date, output_folder, keywords)
+    matched = page.get('keyword_match') if page else None
+    article = finish_article(title, content, url, date, output_folder, keywords, matched)
+    return store_page(url, html, page, article)
+
+def process_rows(rows, output_folder, keywords):
+    # 返回通过关键字与去重筛选的文章
+    prepare_output_folder(output_folder)
+    with ThreadPoolExecutor(max_workers=THREADS) as executor:
+        results = executor.map(lambda row: process_single_article(row, output_folder, keywords), rows)
+        return [article for article in results if article]
 
 def process_articles(csv_file, output_folder, keywords):
-    # 创建输出文件夹（如果不存在）
-    os.makedirs(output_folder, exist_ok=True)
-    
     with open(csv_file, mode='r', encoding='utf-8') as file:
         reader = csv.DictReader(file)
         articles = list(reader)
     
-    with ThreadPoolExecutor(max_workers=THREADS) as executor:
-        executor.map(lambda row: process_single_article(row, output_folder, keywords), articles)
+    return process_rows(articles, output_folder, keywords)
 
-# 示例用法
-if __name__ == "__main__":
-    opml_file = 'feeds.opml'
-    # 从 OPML 文件中提取所有 RSS 源的 URL
-    urls = extract_urls_from_opml(opml_file)
-    # 获取所有文章
-    articles = fetch_all_articles(urls)
-    
-    # 将文章写入 CSV 文件
-    with open('articles.csv', mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file)
-        writer.writerow(['Title', 'URL', 'Date'])
-        for article in articles:
-            writer.writerow([article['title'], article['link'], article['date']])
+async def fetch_articles_from_rss_async(fetcher, url):
+    articles = []
+    try:
+        print(f"Fetching articles from {url}...")
+        with metrics.timer('feed_fetch'):
+            status, headers, content = await fetcher.get(url, headers=feed_cache.request_headers(url))
+        metrics.count('feed_bytes', len(content))
+        unchanged, state = feed_cache.check(url, status, headers, content)
+        if unchanged:
+            metrics.count('feed_cache_hits')
+            print(f"Feed unchanged, skipping: {url}")
+            if state:
+                feed_cache.commit(url, state)
+            return articles
+        metrics.count('feed_cache_misses')
+        with metrics.timer('feed_parse'):
+            articles = await asyncio.to_thread(parse_feed_articles, content)
+        defer_feed_state(url, state, articles)
+    except Exception as e:
+        metrics.count('feed_errors')
+        print(f"Error fetching articles from {url}: {e}")
+    return articles
+
+async def fetch_html_content_async(fetcher, url):
+    try:
+        with metrics.timer('html_fetch'):
+            status, _, html = await fetcher.get(normalize_url(url), as_text=True)
+    except Exception as e:
+        # 连接错误与超时
+        metrics.count('html_errors')
+        mark_failed(url)
+        print(f"Error fetching HTML content from {url}: {e}")
+        return None
+    if status >= 400:
+        metrics.count('html_errors')
+        if http_client.is_transient_status(status):
+            mark_failed(url)
+        print(f"Error fetching HTML content from {url}: HTTP {status}")
+        return None
+    metrics.count('html_bytes', len(html.encode('utf-8')))
+    return html
+
+async def process_single_article_async(fetcher, article, output_folder, keywords):
+    title = article['title']
+    url = article['link']
+    date = article['date']
+    if not claim_article(title, url):
+        return None
+    print(f"Processing article: {title} from {url}")
     
-    print("Articles have been written to articles.csv")
+    html = page = None
+    video_id = get_youtube_video_id(url)
+    if video_id:
+        content = await asyncio.to_thread(fetch_youtube_subtitles, video_id)
+    else:
+        html = await fetch_html_content_async(fetcher, url)
+        page = await asyncio.to_thread(extract_article_page, html) if html else None
+        content = page['text'] if page else None
     
-    # 处理文章并提取内容
-    process_articles('articles.csv', 'articles_text', KEYWORDS)
+    article = await asyncio.to_thread(finish_article, title, content, url, date, output_folder, keywords)
+    return await asyncio.to_thread(store_page, url, html, page, article)
+
+async def fetch_and_process_feed(fetcher, url, output_folder, keywords, csv_output):
+    # 订阅源解析完成后立即开始下载其中的文章，无需等待其他订阅源
+    feed_articles = await fetch_articles_from_rss_async(fetcher, url)
+    if csv_output:
+        for article in feed_articles:
+            csv_output.write(article)
+    results = await asyncio.gather(*(process_single_article_async(fetcher, article, output_folder, keywords) for article in feed_articles))
+    return [article for article in results if article]
+
+async def run_async_pipeline(urls, output_folder, keywords, csv_file=None):
+    from async_fetch import AsyncFetcher
+
+    prepare_output_folder(output_folder)
+    csv_output = ArticlesCsvWriter(csv_file) if csv_file else None
+    try:
+        async with AsyncFetcher(max_in_flight=ASYNC_MAX_IN_FLIGHT, per_host=ASYNC_PER_HOST) as fetcher:
+            results = await asyncio.gather(*(fetch_and_process_feed(fetcher, url, output_folder, keywords, csv_output) for url in urls))
+            return [article for feed_articles in results for article in feed_articles]
+    finally:
+        if csv_output:
+            csv_output.close()
+
+class ArticlesCsvWriter:
+    # 逐条追加写入 articles.csv，供多个线程共享
+    def __init__(self, csv_file):
+        self.csv_file = csv_file
+        self.lock = threading.Lock()
+        self.file = open(csv_file, mode='w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(['Title', 'URL', 'Date'])
+
+    def write(self, article):
+        with self.lock:
+            self.writer.writerow([article['title'], article['link'], article['date']])
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+        print(f"Articles have been written to {self.csv_file}")
+
+def write_articles_csv(articles, csv_file):
+    # 将文章写入 CSV 文件
+    csv_output = ArticlesCsvWriter(csv_file)
+    for article in articles:
+        csv_output.write(article)
+    csv_output.close()
+
+def stream_articles(urls, output_folder, keywords, csv_file=None):
+    # 订阅源条目经有界队列直接交给内容提取线程，内存占用与条目总数无关
+    prepare_output_folder(output_folder)
+    article_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    csv_output = ArticlesCsvWriter(csv_file) if csv_file else None
+    saved = []
+
+    def produce(url):
+        for article in fetch_articles_from_rss(url):
+            if csv_output:
+                csv_output.write(article)
+            # 队列已满时阻塞，避免订阅源抓取远远领先于内容提取
+            article_queue.put(article)
+
+    def consume():
+        while True:
+            article = article_queue.get()
+            if article is None:
+                break
+            row = {'Title': article['title'], 'URL': article['link'], 'Date': article['date']}
+            try:
+                saved_article = process_single_article(row, output_folder, keywords)
+                if saved_article:
+                    saved.append(saved_article)
+            except Exception as e:
+                mark_failed(article['link'])
+                print(f"Error processing article {article['title']}: {e}")
+
+    workers = [threading.Thread(target=consume) for _ in range(THREADS)]
+    for worker in workers:
+        worker.start()
+    try:
+        with ThreadPoolExecutor(max_workers=THREADS) as executor:
+            list(executor.map(produce, urls))
+    finally:
+        for _ in workers:
+            article_queue.put(None)
+        for worker in workers:
+            worker.join()
+        if csv_output:
+            csv_output.close()
+    return saved
+
+def run(opml_file='feeds.opml', output_folder='articles_text', checkpoint=True):
+    # 供进程内流水线调用：返回本次保存的文章列表；checkpoint 为 False 时不写文章库、articles_text/ 和 articles.csv
+    if not checkpoint:
+        output_folder = None
+    if dedup_index:
+        # 试运行仍按索引跳过已处理和重复的文章，但不把本次的文章记为已处理
+        dedup_index.persist = checkpoint
+    csv_file = ARTICLES_CSV if checkpoint else None
+    # 从 OPML 文件中提取所有 RSS 源的 URL
+    urls = extract_urls_from_opml(opml_file)
+
+    if FETCH_ENGINE == 'async':
+        # 订阅源与文章页面在同一个异步流水线中并发获取
+        saved = asyncio.run(run_async_pipeline(urls, output_folder, KEYWORDS, csv_file))
+    elif STREAM_ARTICLES:
+        # 流式处理：条目解析后立即提取内容，articles.csv 仅作为可选输出
+        saved = stream_articles(urls, output_folder, KEYWORDS, csv_file)
+    else:
+        # 获取所有文章
+        articles = fetch_all_articles(urls)
+        if checkpoint:
+            csv_file = csv_file or 'articles.csv'
+            write_articles_csv(articles, csv_file)
+            
+            # 处理文章并提取内容
+            saved = process_articles(csv_file, output_folder, KEYWORDS)
+        else:
+            rows = [{'Title': article['title'], 'URL': article['link'], 'Date': article['date']} for article in articles]
+            saved = process_rows(rows, output_folder, KEYWORDS)
+
+    # 保存订阅源状态并输出缓存命中情况；试运行不保存，下次正式运行仍完整获取这些订阅源
+    if checkpoint:
+        commit_feed_states()
+        feed_cache.save()
+    else:
+        discard_feed_states()
+    feed_cache.report()
+    report_prefilter()
+    if dedup_index:
+        dedup_index.report()
+        if not checkpoint:
+            dedup_index.discard()
+    if page_store:
+        page_store.report()
+    if article_store and checkpoint:
+        article_store.report()
+    http_client.report('fetch')
+    metrics.report('fetch')
+    return saved
+
+# 示例用法
+if __name__ == "__main__":
+    run()
+    if dedup_index:
+        dedup_index.close()
 
@@ -0,0 +1,121 @@
+import os
+import json
+import uuid
+import hashlib
+import threading
+from datetime import datetime
+
+def hash_parts(*parts):
+    # Item hash used by the stages to tell whether a finished item's input is unchanged
+    return hashlib.sha256('\0'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 16), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_inputs(paths, settings=()):
+    # Content hash over files/directories (missing paths hash as missing) plus the named environment settings
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs.sort()
+                for name in sorted(files):
+                    file_path = os.path.join(root, name)
+                    digest.update(f"{os.path.relpath(file_path, path)}:{hash_file(file_path)}\n".encode('utf-8'))
+        elif os.path.isfile(path):
+            digest.update(f"{path}:{hash_file(path)}\n".encode('utf-8'))
+        else:
+            digest.update(f"{path}:missing\n".encode('utf-8'))
+    for name in settings:
+        digest.update(f"{name}={os.getenv(name, '')}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+class StageProgress:
+    # Per-item results of one stage, keyed by item name and the hash of the item's input
+    def __init__(self, manifest, stage):
+        self.manifest = manifest
+        self.stage = stage
+
+    def get(self, key, item_hash):
+        with self.manifest.lock:
+            item = self.manifest.stage_record(self.stage)['items'].get(key)
+        if item and item['hash'] == item_hash:
+            return item['value']
+        return None
+
+    def record(self, key, item_hash, value):
+        # Saved right away so a crash resumes after the last completed item
+        with self.manifest.lock:
+            self.manifest.stage_record(self.stage)['items'][key] = {'hash': item_hash, 'value': value}
+        self.manifest.save()
+
+class PipelineManifest:
+    # Run state of the stage graph: one record per stage with its input hash, outputs and finished items.
+    # A run lasts until the cleanup stage completes; the next run starts with a fresh manifest.
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.data = self._load()
+
+    def _load(self):
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Error loading pipeline manifest {self.path}: {e}")
+        return self._new_run()
+
+    def _new_run(self):
+        return {'run_id': uuid.uuid4().hex, 'started_at': datetime.now().isoformat(timespec='seconds'), 'stages': {}}
+
+    @property
+    def run_id(self):
+        return self.data['run_id']
+
+    def stage_record(self, stage):
+        with self.lock:
+            return self.data['stages'].setdefault(stage, {'input_hash': None, 'completed': False, 'outputs': [], 'items': {}})
+
+    def is_complete(self, stage, input_hash, outputs):
+        with self.lock:
+            record = self.data['stages'].get(stage)
+        return bool(record and record['completed'] and record['input_hash'] == input_hash
+                    and all(os.path.exists(path) for path in outputs))
+
+    def was_interrupted(self, stage):
+        # Started in an earlier attempt of this run but never completed
+        with self.lock:
+            record = self.data['stages'].get(stage)
+        return bool(record and not record['completed'])
+
+    def start(self, stage):
+        with self.lock:
+            self.stage_record(stage)['completed'] = False
+        self.save()
+
+    def complete(self, stage, input_hash, outputs):
+        with self.lock:
+            record = self.stage_record(stage)
+            record.update({'input_hash': input_hash, 'completed': True, 'outputs': list(outputs),
+                           'finished_at': datetime.now().isoformat(timespec='seconds')})
+        self.save()
+
+    def progress(self, stage):
+        return StageProgress(self, stage)
+
+    def reset(self):
+        with self.lock:
+            self.data = self._new_run()
+        self.save()
+
+    def save(self):
+        with self.lock:
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.data, f, ensure_ascii=False, indent=4)
+            os.replace(tmp_path, self.path)
@@ -0,0 +1,24 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+# 各阶段在进程内传递的数据；写入磁盘的文件只作为可选的检查点
+
+@dataclass
+class Article:
+    filename: str  # 与 articles_text/ 中的文件名一致（文章库中保证唯一）
+    text: str  # 与 .txt 文件内容一致：Title/URL/Date 头部加正文（评分后附带 Article Score）
+    score: Optional[float] = None
+    id: Optional[int] = None  # 文章库中的编号，未保存到文章库时为 None
+    url: Optional[str] = None
+    title: Optional[str] = None
+    summary: Optional[dict] = None
+
+@dataclass
+class RatingResult:
+    ratings: Dict[str, float] = field(default_factory=dict)  # 文件名 -> 评分
+    top_articles: List[Article] = field(default_factory=list)
+
+@dataclass
+class NewsletterResult:
+    html_path: str
+    summaries: Dict[str, dict] = field(default_factory=dict)  # 文件名 -> 摘要（含缩略图与来源）
@@ -1,17 +1,36 @@
 import os
 import json
+import threading
 import requests
+import http_client
+import metrics
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from datetime import datetime
 import re
 import pangu  # Import pangu
+from llm_client import chat_completion, report_cache
+from token_budget import count_tokens, fit_to_budget, chunk_text
+from stage_types import Article
+from stage_manifest import hash_parts
+from article_store import open_article_store
 
 # Load environment variables
 load_dotenv()
 
-# Set up custom API endpoint and key
-CUSTOM_API_URL = os.getenv("CUSTOM_API_URL")
-API_KEY = os.getenv("API_KEY")
+SUMMARY_INPUT_TOKENS = int(os.getenv("SUMMARY_INPUT_TOKENS", 12000))  # Token cap for the article text sent to the summary call
+SUMMARY_LONG_INPUT = os.getenv("SUMMARY_LONG_INPUT", "truncate")  # truncate or map_reduce
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", 6000))  # Chunk size for map_reduce
+TRUNCATION_STRATEGY = os.getenv("TRUNCATION_STRATEGY", "head_tail")  # head_tail or salient
+KEYWORDS = os.getenv("KEYWORDS", "").split(',')
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "parallel")  # sequential, parallel or combined
+SUMMARY_WORKERS = int(os.getenv("SUMMARY_WORKERS", 4))  # Number of articles summarized at once
+TOP_ARTICLES = int(os.getenv("TOP_ARTICLES", 5))
+ARTICLES_TEXT_EXPORT = os.getenv("ARTICLES_TEXT_EXPORT", "false").lower() == "true"  # Also write summary_*.txt when using the article store
+
+# Summaries go into the article store's summary column; the summary_*.txt files are an optional export
+article_store = open_article_store()
+writes_text = article_store is None or ARTICLES_TEXT_EXPORT
 
 def read_article(file_path):
     with open(file_path, 'r', encoding='utf-8') as file:
@@ -37,12 +56,58 @@ def extract_url_and_title(content):
     
     return url, title
 
-def get_chinese_title_and_summary(title, content, url):
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {API_KEY}"
+def remove_rating_lines(content):
+    # The score lines appended by the rating stage are not part of the article
+    return re.sub(r'\n*Article Score: [^\n]*\nRated on: [^\n]+', '', content)
+
+def summarize_chunk(title, chunk, index, total):
+    payload = {
+        "model": "gpt-4o",
+        "messages": [
+            {"role": "system", "content": "You are an AI assistant that condenses one part of a long article. Keep the key facts, names and numbers. Answer in the article's language in at most 8 sentences."},
+            {"role": "user", "content": f"Condense part {index} of {total} of the article \"{title}\":\n\n{chunk}"}
+        ]
     }
-    
+    return chat_completion(payload)['choices'][0]['message']['content'].strip()
+
+def prepare_summary_input(title, content, label):
+    # Long inputs are either truncated to the budget or condensed chunk by chunk (map-reduce)
+    tokens = count_tokens(content, 'gpt-4o')
+    if tokens <= SUMMARY_INPUT_TOKENS or SUMMARY_LONG_INPUT != 'map_reduce':
+        return fit_to_budget(content, SUMMARY_INPUT_TOKENS, TRUNCATION_STRATEGY, KEYWORDS, 'gpt-4o', label)
+    chunks = chunk_text(content, SUMMARY_CHUNK_TOKENS, 'gpt-4o')
+    condensed = '\n\n'.join(summarize_chunk(title, chunk, i, len(chunks)) for i, chunk in enumerate(chunks, start=1))
+    print(f"Tokens for {label}: {tokens} -> {count_tokens(condensed, 'gpt-4o')} (map-reduce over {len(chunks)} chunks)")
+    # The condensed text may still be long if there were many chunks
+    return fit_to_budget(condensed, SUMMARY_INPUT_TOKENS, TRUNCATION_STRATEGY, KEYWORDS, 'gpt-4o', label)
+
+def parse_combined_response(raw_response):
+    # Expect {"title": ..., "summary": ...}, possibly wrapped in a Markdown code fence
+    text = re.sub(r'^```(?:json)?\s*|\s*```$', '', raw_response.strip())
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None, None
+    if not isinstance(data, dict) or not data.get('title') or not data.get('summary'):
+        return None, None
+    return str(data['title']).strip(), str(data['summary']).strip()
+
+def get_combined_title_and_summary(title, content):
+    # One call returning both the translated title and the summary as JSON
+    payload = {
+        "model": "gpt-4o",
+        "messages": [
+            {"role": "system", "content": "You are an AI assistant that translates article titles to Chinese (zh-CN) and summarizes articles in Chinese (zh-CN). Respond only with a JSON object with two keys: \"title\" (the translated title without any additional text) and \"summary\" (a concise summary in about 3-5 sentences in Chinese)."},
+            {"role": "user", "content": f"Translate the title and summarize the following article:\n\nTitle: {title}\n\nContent:\n{content}"}
+        ]
+    }
+    raw_response = chat_completion(payload, lambda text: parse_combined_response(text)[0])['choices'][0]['message']['content']
+    chinese_title, chinese_summary = parse_combined_response(raw_response)
+    if not chinese_title:
+        print(f"Malformed combined response, falling back to separate calls: {raw_response}")
+    return chinese_title, chinese_summary
+
+def get_chinese_title_and_summary(title, content, url, executor=None):
     # Translate title
     title_payload = {
         "model": "gpt-4o",  # Updated model
@@ -52,25 +117,32 @@ def get_chinese_title_and_summary(title, content, url):
         ]
     }
     
-    # Summarize and translate content
-    content_payload = {
-        "model": "gpt-4o",  # Updated model
-        "messages": [
-            {"role": "system", "content": "You are an AI assistant that summarizes articles in Chinese (zh-CN). Provide a concise summary in about 3-5 sentences in Chinese."},
-            {"role": "user", "content": f"Summarize the following article in Chinese (zh-CN):\n\nTitle: {title}\n\nContent:\n{content}"}
-        ]
-    }
-    
     try:
-        # Get translated title
-        title_response = requests.post(CUSTOM_API_URL, headers=headers, json=title_payload)
-        title_response.raise_for_status()
-        chinese_title = title_response.json()['choices'][0]['message']['content'].strip()
-
-        # Get Chinese summary
-        content_response = requests.post(CUSTOM_API_URL, headers=headers, json=content_payload)
-        content_response.raise_for_status()
-        chinese_summary = content_response.json()['choices'][0]['message']['content'].strip()
+        # In parallel mode the title translation runs while the content is prepared and summarized
+        title_future = executor.submit(chat_completion, title_payload) if executor and SUMMARY_MODE == 'parallel' else None
+
+        content = prepare_summary_input(title, content, title)
+
+        chinese_title = chinese_summary = None
+        if SUMMARY_MODE == 'combined':
+            chinese_title, chinese_summary = get_combined_title_and_summary(title, content)
+
+        # Summarize and translate content
+        content_payload = {
+            "model": "gpt-4o",  # Updated model
+            "messages": [
+                {"role": "system", "content": "You are an AI assistant that summarizes articles in Chinese (zh-CN). Provide a concise summary in about 3-5 sentences in Chinese."},
+                {"role": "user", "content": f"Summarize the following article in Chinese (zh-CN):\n\nTitle: {title}\n\nContent:\n{content}"}
+            ]
+        }
+
+        if not chinese_title:
+            # Get translated title (served from the shared response cache when unchanged)
+            title_response = title_future.result() if title_future else chat_completion(title_payload)
+            chinese_title = title_response['choices'][0]['message']['content'].strip()
+
+            # Get Chinese summary
+            chinese_summary = chat_completion(content_payload)['choices'][0]['message']['content'].strip()
         
         # Apply pangu spacing
         chinese_title = pangu.spacing_text(chinese_title)
@@ -81,48 +153,141 @@ def get_chinese_title_and_summary(title, content, url):
         print(f"Error getting Chinese title and summary: {e}")
         return None, None
 
-def main():
-    high_rated_dir = 'high_rated_articles'
-    summaries_dir = 'article_summaries'
+def load_articles(high_rated_dir):
+    # When run on its own, read the high-rated articles written by the rating stage
+    filenames = [filename for filename in os.listdir(high_rated_dir) if filename.endswith('.txt')]
+    return [Article(filename, read_article(os.path.join(high_rated_dir, filename))) for filename in filenames]
+
+def summarize_article(article, summaries_dir=None, executor=None):
+    filename = article.filename
+    print(f"Processing {filename}...")
+    
+    content = article.text
+    
+    if article.url is not None:
+        url, title = article.url, article.title
+    else:
+        url, title = extract_url_and_title(content)
+    # Remove URL, title and score lines so re-rating an article does not change the summary input
+    content = '\n'.join(line for line in remove_rating_lines(content).split('\n') if not line.startswith(('URL:', 'Title:')))
+    
+    chinese_title, chinese_summary = get_chinese_title_and_summary(title, content, url, executor)
+    
+    if chinese_summary and chinese_title:
+        summary = {
+            "url": url,
+            "original_title": title,
+            "chinese_title": chinese_title,
+            "chinese_summary": chinese_summary
+        }
+        if summaries_dir and article_store and article.id is not None:
+            article_store.set_summary(article.id, summary)
+        if summaries_dir and writes_text:
+            summary_filename = f"summary_{filename}"
+            summary_path = os.path.join(summaries_dir, summary_filename)
+            write_summary(summary_path, f"标题：{chinese_title}\n\nURL: {url}\n\n{chinese_summary}")
+            print(f"Chinese title and summary for {filename} saved.")
+        return summary
+    print(f"Failed to get Chinese title and summary for {filename}")
+    return None
+
+def load_previous_results(output_file='article_summaries.json'):
+    # Summaries written by an earlier, possibly interrupted run; each entry carries the input_hash it was made from
+    if not os.path.exists(output_file):
+        return {}
+    try:
+        with open(output_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def save_results(results, filenames, hashes, output_file='article_summaries.json'):
+    # Keep the directory order and replace the file atomically so a crash never leaves it half-written
+    ordered = {filename: dict(results[filename], input_hash=hashes[filename]) for filename in filenames if filename in results}
+    tmp_file = f"{output_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        json.dump(ordered, f, ensure_ascii=False, indent=4)
+    os.replace(tmp_file, output_file)
+
+def summary_hash(article):
+    return hash_parts(remove_rating_lines(article.text), SUMMARY_MODE, SUMMARY_INPUT_TOKENS, SUMMARY_LONG_INPUT, TRUNCATION_STRATEGY)
+
+def run(articles=None, high_rated_dir='high_rated_articles', summaries_dir='article_summaries', checkpoint=True, progress=None):
+    # In-process entry point: summarizes the given articles (or the files in high_rated_dir) and returns
+    # {filename: summary}; with checkpoint=False nothing is written to disk.
+    # progress is this stage's pipeline manifest record; articles whose input is unchanged reuse their summary.
+    # With the article store, the top TOP_ARTICLES of the current edition are queried instead of reading files
+    if articles is None:
+        articles = article_store.top(TOP_ARTICLES) if checkpoint and article_store else load_articles(high_rated_dir)
+    filenames = [article.filename for article in articles]
+    hashes = {article.filename: summary_hash(article) for article in articles}
     results = {}
+    results_lock = threading.Lock()
+
+    # Without a pipeline manifest (a standalone rerun), finished entries of article_summaries.json are kept
+    previous_results = load_previous_results() if checkpoint and not progress else {}
+    pending = []
+    for article in articles:
+        if article.summary:
+            # The article store keeps the summary until the article's text changes
+            results[article.filename] = article.summary
+            continue
+        previous = progress.get(article.filename, hashes[article.filename]) if progress else None
+        earlier = previous_results.get(article.filename)
+        if not previous and earlier and earlier.get('input_hash') == hashes[article.filename]:
+            previous = {key: value for key, value in earlier.items() if key != 'input_hash'}
+        if previous:
+            results[article.filename] = previous
+        else:
+            pending.append(article)
+    if results:
+        print(f"Reusing {len(results)} earlier summaries")
 
     # Ensure summaries_dir exists
-    os.makedirs(summaries_dir, exist_ok=True)
-
-    for filename in os.listdir(high_rated_dir):
-        if filename.endswith('.txt'):
-            file_path = os.path.join(high_rated_dir, filename)
-            print(f"Processing {filename}...")
-            
-            content = read_article(file_path)
-            
-            url, title = extract_url_and_title(content)
-            # Remove URL and title lines from content
-            content = '\n'.join(line for line in content.split('\n') if not line.startswith(('URL:', 'Title:')))
-            
-            chinese_title, chinese_summary = get_chinese_title_and_summary(title, content, url)
-            
-            if chinese_summary and chinese_title:
-                summary_filename = f"summary_{filename}"
-                summary_path = os.path.join(summaries_dir, summary_filename)
-                write_summary(summary_path, f"标题：{chinese_title}\n\nURL: {url}\n\n{chinese_summary}")
-                
-                results[filename] = {
-                    "url": url,
-                    "original_title": title,
-                    "chinese_title": chinese_title,
-                    "chinese_summary": chinese_summary
-                }
-                print(f"Chinese title and summary for {filename} saved.")
-            else:
-                print(f"Failed to get Chinese title and summary for {filename}")
-
-    # Save results to a JSON file
-    with open('article_summaries.json', 'w', encoding='utf-8') as f:
-        json.dump(results, f, ensure_ascii=False, indent=4)
-
-    print("Summaries saved to article_summaries.json")
-    print(f"Article summaries saved in {summaries_dir}")
+    if checkpoint:
+        if writes_text:
+            os.makedirs(summaries_dir, exist_ok=True)
+    else:
+        summaries_dir = None
+
+    # Title calls started in parallel mode get their own pool so they never wait behind article workers
+    title_executor = ThreadPoolExecutor(max_workers=SUMMARY_WORKERS) if SUMMARY_MODE == 'parallel' else None
+
+    def process(article):
+        with metrics.timer('summarize_article'):
+            result = summarize_article(article, summaries_dir, title_executor)
+        if not result:
+            metrics.count('summary_errors')
+        if result:
+            # Write finished work immediately
+            with results_lock:
+                results[article.filename] = result
+                if checkpoint:
+                    save_results(results, filenames, hashes)
+            if progress:
+                progress.record(article.filename, hashes[article.filename], result)
+
+    try:
+        with ThreadPoolExecutor(max_workers=SUMMARY_WORKERS) as executor:
+            list(executor.map(process, pending))
+    finally:
+        if title_executor:
+            title_executor.shutdown()
+
+    if checkpoint:
+        # Save results to a JSON file
+        save_results(results, filenames, hashes)
+
+        print("Summaries saved to article_summaries.json")
+        if writes_text:
+            print(f"Article summaries saved in {summaries_dir}")
+    report_cache()
+    http_client.report('summarize')
+    metrics.report('summarize')
+    return {filename: results[filename] for filename in filenames if filename in results}
+
+def main():
+    run()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
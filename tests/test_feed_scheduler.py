@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+
+from feed_scheduler import FeedScheduler, CronSchedule
+
+URL = 'https://example.com/feed.xml'
+NOW = 1_700_000_000.0
+
+def make_scheduler(tmp_path):
+    scheduler = FeedScheduler(str(tmp_path / 'schedule.json'), min_interval=60, max_interval=86400, default_interval=3600)
+    scheduler.sync([URL], now=NOW)
+    return scheduler
+
+def test_error_backoff_doubles_from_base_interval(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    intervals = [scheduler.reschedule(URL, {'error': 'HTTP 500'}, now=NOW) for _ in range(4)]
+    assert intervals == [7200, 14400, 28800, 57600]
+
+def test_error_backoff_is_capped(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    for _ in range(10):
+        interval = scheduler.reschedule(URL, {'error': 'timeout'}, now=NOW)
+    assert interval == 86400
+
+def test_success_after_errors_starts_from_base_interval(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    for _ in range(3):
+        scheduler.reschedule(URL, {'error': 'timeout'}, now=NOW)
+    # An unchanged feed slows down from the interval before the errors, not from the backed-off one
+    assert scheduler.reschedule(URL, {}, now=NOW) == 5400
+    assert scheduler.reschedule(URL, {'error': 'timeout'}, now=NOW) == 10800
+
+def test_interval_follows_observed_posting_rate(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    entry_times = [NOW - 600 * i for i in range(5)]
+    # Entries every 10 minutes: poll twice per gap, but never below min_interval
+    assert scheduler.reschedule(URL, {'entry_times': entry_times}, now=NOW) == 300
+
+def test_interval_respects_ttl(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    entry_times = [NOW - 600 * i for i in range(5)]
+    assert scheduler.reschedule(URL, {'entry_times': entry_times, 'ttl': '120'}, now=NOW) == 7200
+
+def test_pop_due_returns_only_due_feeds(tmp_path):
+    scheduler = make_scheduler(tmp_path)
+    assert scheduler.pop_due(now=NOW - 1) == []
+    assert scheduler.pop_due(now=NOW + 61) == [URL]
+    assert scheduler.pop_due(now=NOW + 61) == []
+
+def test_cron_daily():
+    cron = CronSchedule('0 8 * * *')
+    assert cron.next_after(datetime(2024, 1, 1, 7, 59)) == datetime(2024, 1, 1, 8, 0)
+    assert cron.next_after(datetime(2024, 1, 1, 8, 0)) == datetime(2024, 1, 2, 8, 0)
+
+def test_cron_steps_and_lists():
+    cron = CronSchedule('*/15 9,18 * * *')
+    assert cron.next_after(datetime(2024, 1, 1, 9, 20)) == datetime(2024, 1, 1, 9, 30)
+    assert cron.next_after(datetime(2024, 1, 1, 9, 50)) == datetime(2024, 1, 1, 18, 0)
+
+def test_cron_weekdays():
+    # 2024-01-06 is a Saturday; 1-5 is Monday to Friday
+    cron = CronSchedule('30 7 * * 1-5')
+    assert cron.next_after(datetime(2024, 1, 6, 12, 0)) == datetime(2024, 1, 8, 7, 30)
+    assert CronSchedule('0 0 * * 7').next_after(datetime(2024, 1, 6, 12, 0)) == datetime(2024, 1, 7, 0, 0)
+
+def test_cron_day_or_weekday():
+    # With both day of month and day of week restricted, either one matches (as in cron)
+    cron = CronSchedule('0 0 10 * 1')
+    assert cron.next_after(datetime(2024, 1, 2, 0, 0)) == datetime(2024, 1, 8, 0, 0)
+    assert cron.next_after(datetime(2024, 1, 8, 0, 0)) == datetime(2024, 1, 10, 0, 0)
+
+def test_cron_rejects_invalid_expressions():
+    with pytest.raises(ValueError):
+        CronSchedule('0 8 * *')
+    with pytest.raises(ValueError):
+        CronSchedule('0 0 31 2 *').next_after(datetime(2024, 1, 1))
@@ -0,0 +1,110 @@
+import re
+from functools import lru_cache
+
+# tiktoken 为可选依赖，未安装时按字符数估算
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# 单个片段的最大字符数，超出时继续按句子或固定长度切分（如没有换行的 YouTube 字幕）
+MAX_UNIT_CHARS = 2000
+CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u9fff\uac00-\ud7af]')
+SENTENCE_PATTERN = re.compile(r'(?<=[.!?。！？])\s*')
+OMISSION_MARKER = '[...]'
+
+@lru_cache(maxsize=None)
+def get_encoding(model):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding('cl100k_base')
+
+def count_tokens(text, model='gpt-3.5-turbo'):
+    if tiktoken is not None:
+        return len(get_encoding(model).encode(text, disallowed_special=()))
+    # 估算：中日韩字符约一个 token，其余约 4 个字符一个 token
+    cjk = len(CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk) // 4 + 1
+
+def split_units(text):
+    # 按段落切分，过长的段落再按句子切分，仍然过长则按固定长度切分
+    units = []
+    for paragraph in text.split('\n'):
+        if not paragraph.strip():
+            continue
+        if len(paragraph) <= MAX_UNIT_CHARS:
+            units.append(paragraph)
+            continue
+        for sentence in SENTENCE_PATTERN.split(paragraph):
+            for i in range(0, len(sentence), MAX_UNIT_CHARS):
+                if sentence[i:i + MAX_UNIT_CHARS].strip():
+                    units.append(sentence[i:i + MAX_UNIT_CHARS])
+    return units
+
+def take_within_budget(units, budget, model):
+    taken = []
+    used = 0
+    for unit in units:
+        tokens = count_tokens(unit, model)
+        if used + tokens > budget:
+            break
+        taken.append(unit)
+        used += tokens
+    return taken
+
+def truncate_head_tail(text, budget, model='gpt-3.5-turbo'):
+    # 保留开头约三分之二和结尾约三分之一的预算
+    units = split_units(text)
+    head = take_within_budget(units, budget * 2 // 3, model)
+    tail = take_within_budget(reversed(units[len(head):]), budget - budget * 2 // 3, model)
+    return '\n'.join(head + [OMISSION_MARKER] + list(reversed(tail)))
+
+def select_salient(text, budget, keywords=(), model='gpt-3.5-turbo'):
+    # 按关键字命中数和位置给段落打分，选出得分最高的段落并保持原有顺序
+    units = split_units(text)
+    lowered_keywords = [keyword.lower() for keyword in keywords if keyword.strip()]
+    scored = []
+    for index, unit in enumerate(units):
+        lowered = unit.lower()
+        hits = sum(lowered.count(keyword) for keyword in lowered_keywords)
+        position_bonus = 2 if index < 3 else (1 if index >= len(units) - 2 else 0)
+        scored.append((hits * 3 + position_bonus + min(len(unit), 400) / 400, index))
+    selected = []
+    used = 0
+    for _, index in sorted(scored, reverse=True):
+        tokens = count_tokens(units[index], model)
+        if used + tokens <= budget:
+            selected.append(index)
+            used += tokens
+    return '\n'.join(units[index] for index in sorted(selected))
+
+def fit_to_budget(text, budget, strategy='head_tail', keywords=(), model='gpt-3.5-turbo', label=''):
+    # 将输入压缩到 token 预算以内，并记录处理前后的 token 数
+    before = count_tokens(text, model)
+    if before <= budget:
+        print(f"Tokens for {label}: {before} (within budget {budget})")
+        return text
+    if strategy == 'salient':
+        text = select_salient(text, budget, keywords, model)
+    else:
+        text = truncate_head_tail(text, budget, model)
+    print(f"Tokens for {label}: {before} -> {count_tokens(text, model)} (budget {budget}, {strategy})")
+    return text
+
+def chunk_text(text, chunk_tokens, model='gpt-3.5-turbo'):
+    # 供 map-reduce 摘要使用：切分为不超过 chunk_tokens 的连续片段
+    chunks = []
+    current = []
+    used = 0
+    for unit in split_units(text):
+        tokens = count_tokens(unit, model)
+        if current and used + tokens > chunk_tokens:
+            chunks.append('\n'.join(current))
+            current = []
+            used = 0
+        current.append(unit)
+        used += tokens
+    if current:
+        chunks.append('\n'.join(current))
+    return chunks